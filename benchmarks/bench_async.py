@@ -0,0 +1,90 @@
+"""
+Compare blocking and asyncio fan-out reads against a local stand-in Sheets API.
+
+Usage (from the repository root, with httpx installed):
+    python benchmarks/bench_async.py [reads] [latency_ms]
+
+The stand-in server answers every values request after latency_ms. The
+script sends the same reads from one thread three ways: one after another
+through sheets_http, through sheets_http with SHEETS_ASYNC (same calls,
+async transport) and as one gather() on the asyncio client, and prints the
+wall time of each. The stand-in speaks plain HTTP/1.1, so this measures
+overlap, not HTTP/2 multiplexing.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.common import sheets_async, sheets_http, sheets_quota  # noqa: E402
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency = latency
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        payload = json.dumps({"range": "Sheet1!A1:C3", "values": [["id", "name", "status"], ["1", "a", "open"]]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def timed(func):
+    started = time.perf_counter()
+    results = func()
+    return results, time.perf_counter() - started
+
+
+def main():
+    if not sheets_async.HTTPX_AVAILABLE:
+        raise SystemExit("httpx is not installed (pip install 'httpx[http2]')")
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    server = StandInServer(latency_ms / 1000.0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Measure I/O overlap, not the quota buckets
+    sheets_quota._PROJECT_LIMITS["read"] = 0
+    sheets_quota._USER_LIMITS["read"] = 0
+    base = f"http://127.0.0.1:{server.server_address[1]}/v4/spreadsheets/bench/values"
+    urls = [f"{base}/Sheet{i}!A1:C3" for i in range(reads)]
+    print(f"{reads} reads from one thread, {latency_ms:.0f} ms upstream latency")
+
+    def blocking():
+        return [sheets_http.get(url, timeout=10).status_code for url in urls]
+
+    def fan_out():
+        responses = sheets_async.run(sheets_async.gather([sheets_async.get(url, timeout=10) for url in urls]))
+        return [response.status_code for response in responses]
+
+    sheets_async.ASYNC_ENABLED = False
+    statuses, elapsed = timed(blocking)
+    print(f"{'requests session, sequential':34s} ok={statuses.count(200):4d}  elapsed={elapsed * 1000:8.1f} ms")
+    sheets_async.ASYNC_ENABLED = True
+    statuses, elapsed = timed(blocking)
+    print(f"{'async transport, sequential':34s} ok={statuses.count(200):4d}  elapsed={elapsed * 1000:8.1f} ms")
+    statuses, elapsed = timed(fan_out)
+    print(f"{'async client, gather()':34s} ok={statuses.count(200):4d}  elapsed={elapsed * 1000:8.1f} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark the row-wise and columnar filter paths of filter_google_sheets_data.
+
+Usage (from the repository root):
+    python benchmarks/bench_filters.py [row_count]
+
+Builds a synthetic sheet shaped like a Sheets API values response (rows of
+strings, some short rows and non-numeric cells), checks that both paths
+return identical rows for each scenario and prints the timings.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.common import sheets_filters  # noqa: E402
+
+HEADERS = ["id", "name", "amount", "quantity", "status"]
+
+SCENARIOS = [
+    ("amount > 500", [
+        {"column_name": "amount", "operator": ">", "value": "500"},
+    ], "AND"),
+    ("amount >= 100 AND quantity < 10", [
+        {"column_name": "amount", "operator": ">=", "value": "100"},
+        {"column_name": "quantity", "operator": "<", "value": "10"},
+    ], "AND"),
+    ("amount < 5 OR quantity = 42 OR status != open", [
+        {"column_name": "amount", "operator": "<", "value": "5"},
+        {"column_name": "quantity", "operator": "=", "value": "42"},
+        {"column_name": "status", "operator": "!=", "value": "open"},
+    ], "OR"),
+]
+
+
+def build_rows(row_count, seed=7):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(row_count):
+        amount = f"{rnd.uniform(0, 1000):.2f}" if rnd.random() > 0.01 else "n/a"
+        row = [str(i), f"name-{i}", amount, str(rnd.randint(0, 100)), rnd.choice(["open", "closed"])]
+        if rnd.random() < 0.01:
+            row = row[:rnd.randint(1, 4)]  # the API drops trailing empty cells
+        rows.append(row)
+    return list(enumerate(rows, start=2))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    indexed_rows = build_rows(row_count)
+    print(f"{row_count} rows, numpy available: {sheets_filters.NUMPY_AVAILABLE}")
+    for label, filters, logic in SCENARIOS:
+        row_result, row_time = timed(sheets_filters.filter_indexed_rows, indexed_rows, HEADERS, filters, logic)
+        col_result, col_time = timed(sheets_filters.filter_indexed_rows_columnar, indexed_rows, HEADERS, filters, logic)
+        if row_result != col_result:
+            raise SystemExit(f"Mismatch for '{label}': {len(row_result)} vs {len(col_result)} rows")
+        print(
+            f"{label:48s} matched={len(row_result):7d}  "
+            f"row-wise={row_time * 1000:8.1f} ms  columnar={col_time * 1000:8.1f} ms  "
+            f"speedup={row_time / col_time if col_time else float('inf'):5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
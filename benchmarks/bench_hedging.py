@@ -0,0 +1,97 @@
+"""
+Compare read tail latency with and without hedging against a local fake server.
+
+Usage (from the repository root):
+    python benchmarks/bench_hedging.py [calls] [slow_fraction]
+
+The fake server answers in a few milliseconds, except for slow_fraction of
+the requests which take 500 ms. The same sequence of reads is sent through
+sheets_http with hedging off and on, and the script prints p50/p95/p99 and
+how many reads were hedged.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.common import sheets_hedge, sheets_http, sheets_quota  # noqa: E402
+
+SLOW_SECONDS = 0.5
+
+
+class SlowSheetsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, slow_fraction):
+        super().__init__(("127.0.0.1", 0), SlowSheetsHandler)
+        self.slow_fraction = slow_fraction
+        self.random = random.Random(7)
+
+
+class SlowSheetsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.server.random.random() < self.server.slow_fraction:
+            time.sleep(SLOW_SECONDS)
+        else:
+            time.sleep(0.003)
+        payload = json.dumps({"range": "Sheet1!A1:B2", "values": [["id", "name"], ["1", "a"]]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def run(url, calls):
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        sheets_http.get(url, timeout=10)
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    slow_fraction = float(sys.argv[2]) if len(sys.argv) > 2 else 0.03
+    server = SlowSheetsServer(slow_fraction)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Measure latency, not the quota buckets
+    sheets_quota._PROJECT_LIMITS["read"] = 0
+    sheets_quota._USER_LIMITS["read"] = 0
+    url = f"http://127.0.0.1:{server.server_address[1]}/v4/spreadsheets/bench/values/Sheet1!A1:B2"
+    print(f"{calls} sequential reads, {slow_fraction:.0%} answered after {SLOW_SECONDS * 1000:.0f} ms")
+    for hedged in (False, True):
+        sheets_hedge.HEDGE_READS = hedged
+        if hedged:
+            # Seed the latency window so hedging is active from the first timed read
+            run(url, sheets_hedge.HEDGE_MIN_SAMPLES)
+        before = sheets_hedge.hedge_stats()["hedged"]
+        latencies = run(url, calls)
+        print(
+            f"hedging {'on ' if hedged else 'off'}  "
+            f"p50={percentile(latencies, 0.50) * 1000:7.1f} ms  "
+            f"p95={percentile(latencies, 0.95) * 1000:7.1f} ms  "
+            f"p99={percentile(latencies, 0.99) * 1000:7.1f} ms  "
+            f"hedged={sheets_hedge.hedge_stats()['hedged'] - before}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Drive sheets_http against a local fake Sheets server that answers 429s.
+
+Usage (from the repository root):
+    python benchmarks/bench_throttling.py [calls] [server_limit_per_second]
+
+The fake server accepts server_limit_per_second requests per API key in
+each one-second window and answers the rest with 429 and Retry-After: 1.
+A burst of concurrent reads is sent through sheets_http, once with the quota
+buckets sized to the server's limit and once with them effectively off, and
+the script reports how many calls succeeded, how many 429s the server sent
+and how long the burst took.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# A one-second burst matches the fake server's one-second windows
+os.environ.setdefault("SHEETS_QUOTA_BURST_SECONDS", "1")
+
+from src.common import sheets_http, sheets_quota  # noqa: E402
+
+
+class FakeSheetsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, limit_per_second):
+        super().__init__(("127.0.0.1", 0), FakeSheetsHandler)
+        self.limit_per_second = limit_per_second
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.accepted = 0
+        self.rejected = 0
+
+    def admit(self, api_key):
+        window = int(time.monotonic())
+        with self.lock:
+            key = (api_key, window)
+            self.windows[key] = self.windows.get(key, 0) + 1
+            if self.windows[key] > self.limit_per_second:
+                self.rejected += 1
+                return False
+            self.accepted += 1
+            return True
+
+
+class FakeSheetsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        api_key = parse_qs(urlparse(self.path).query).get("key", [""])[0]
+        if self.server.admit(api_key):
+            status, headers, body = 200, {}, {"range": "Sheet1!A1:B2", "values": [["id", "name"], ["1", "a"]]}
+        else:
+            status, headers, body = 429, {"Retry-After": "1"}, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_burst(server, calls, per_minute):
+    sheets_quota.reset()
+    sheets_quota._USER_LIMITS["read"] = per_minute
+    server.accepted = server.rejected = 0
+    url = f"http://127.0.0.1:{server.server_address[1]}/v4/spreadsheets/bench/values/Sheet1!A1:B2?key=bench"
+
+    def read(_):
+        try:
+            return sheets_http.get(url, timeout=10).status_code == 200
+        except sheets_http.ThrottledError:
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        ok = sum(pool.map(read, range(calls)))
+    return ok, server.rejected, time.perf_counter() - started
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    server = FakeSheetsServer(limit)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sheets_quota._PROJECT_LIMITS["read"] = 0
+    print(f"{calls} concurrent reads, fake server allows {limit}/s per API key")
+    for label, per_minute in (("quota buckets at server limit", limit * 60), ("quota buckets off", 0)):
+        ok, rejected, elapsed = run_burst(server, calls, per_minute)
+        print(f"{label:32s} succeeded={ok:4d}/{calls}  server 429s={rejected:4d}  elapsed={elapsed:6.2f} s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
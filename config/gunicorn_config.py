@@ -1,4 +1,6 @@
 # https://docs.gunicorn.org/en/stable/settings.html
+import os
+
 bind = "0.0.0.0:8080"
 # Enable prints to be shown immediately
 accesslog = "-"  # Print access log to stdout
@@ -6,6 +8,11 @@ errorlog = "-"   # Print error log to stdout
 capture_output = True
 enable_stdio_inheritance = True
 
-workers = 2
-threads = 1
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
 timeout = 360
+
+# Workers size their shared Sheets HTTP connection pool and quota share from these, and append
+# batching needs threads > 1 (see src/common/sheets_http.py, sheets_quota.py, sheets_append_batcher.py)
+os.environ["GUNICORN_WORKERS"] = str(workers)
+os.environ["GUNICORN_THREADS"] = str(threads)
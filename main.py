@@ -1,9 +1,16 @@
 from flask import Flask
 from workflows_cdk import Router
+from src.common import app_log, app_metrics, app_trace
 
 # Create Flask app
 app = Flask(__name__)
 router = Router(app)
+# Per-request debug log sampling (see src/common/app_log.py)
+app_log.install(app)
+# Prometheus-text metrics route and per-module latency histograms (see src/common/app_metrics.py)
+app_metrics.install(app)
+# Opt-in per-request timing breakdown and trace export (see src/common/app_trace.py)
+app_trace.install(app)
 
 if __name__ == "__main__":
-    router.run_app(app)
\ No newline at end of file
+    router.run_app(app)
@@ -0,0 +1,3 @@
+"""
+Shared helpers used by every Google Sheets module under src/modules.
+"""
@@ -0,0 +1,243 @@
+"""
+Structured, non-blocking logging for the route handlers and shared helpers.
+
+Handlers log through get_logger(__name__) instead of print(). Records are
+put on a bounded in-memory queue and written as JSON lines to stderr by a
+background listener thread, so a request never waits on stdout. Arguments
+are summarized before formatting: long strings are truncated and large
+lists/dicts are reduced to their size, which keeps request payloads and
+sheet data out of the logs.
+
+DEBUG output is decided once per request. It is kept when SHEETS_LOG_LEVEL
+is DEBUG and the request is sampled (SHEETS_LOG_SAMPLE_RATE, with per-route
+overrides in SHEETS_LOG_SAMPLE_RATES), or when the request carries the
+SHEETS_LOG_DEBUG_HEADER header set to the SHEETS_LOG_DEBUG_TOKEN secret. The
+header is ignored while no token is configured, so clients cannot turn on
+debug logging by default. Otherwise a debug() call costs one
+context-variable lookup.
+"""
+import atexit
+import contextvars
+import hmac
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+# === ENVIRONMENT VARIABLES ===
+LOG_LEVEL = os.environ.get("SHEETS_LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("SHEETS_LOG_SAMPLE_RATE", "1.0"))
+# Comma-separated path-prefix=rate pairs, e.g. "/filter_google_sheets_data=0.05,/google_sheets_reader=0.1"
+LOG_SAMPLE_RATES = os.environ.get("SHEETS_LOG_SAMPLE_RATES", "")
+LOG_DEBUG_HEADER = os.environ.get("SHEETS_LOG_DEBUG_HEADER", "X-Debug-Log")
+# Secret the debug header must carry; empty disables the header
+LOG_DEBUG_TOKEN = os.environ.get("SHEETS_LOG_DEBUG_TOKEN", "")
+LOG_MAX_CHARS = int(os.environ.get("SHEETS_LOG_MAX_CHARS", "500"))
+LOG_MAX_ITEMS = int(os.environ.get("SHEETS_LOG_MAX_ITEMS", "20"))
+LOG_QUEUE_SIZE = int(os.environ.get("SHEETS_LOG_QUEUE_SIZE", "10000"))
+# === END ENVIRONMENT VARIABLES ===
+
+_BASE_LEVEL = getattr(logging, LOG_LEVEL, logging.INFO)
+_debug_enabled = contextvars.ContextVar("sheets_log_debug", default=_BASE_LEVEL <= logging.DEBUG)
+_route = contextvars.ContextVar("sheets_log_route", default=None)
+
+_lock = threading.Lock()
+_listener = None
+_listener_pid = None
+_queue = None
+_stats = {"dropped": 0}
+
+
+def _parse_sample_rates(spec):
+    rates = []
+    for item in spec.split(","):
+        prefix, _, rate = item.strip().partition("=")
+        if prefix and rate:
+            rates.append((prefix, float(rate)))
+    # Longest prefix wins
+    return sorted(rates, key=lambda pair: len(pair[0]), reverse=True)
+
+
+_SAMPLE_RATES = _parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+def summarize(value):
+    """
+    Return a log-safe rendering of value: large containers become their size
+    and long strings are cut to LOG_MAX_CHARS.
+    """
+    if isinstance(value, (list, tuple, dict, set)) and len(value) > LOG_MAX_ITEMS:
+        return f"<{type(value).__name__} of {len(value)} items>"
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    text = value if isinstance(value, str) else str(value)
+    if len(text) > LOG_MAX_CHARS:
+        return f"{text[:LOG_MAX_CHARS]}... <{len(text)} chars>"
+    return text
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        route = getattr(record, "route", None)
+        if route:
+            entry["route"] = route
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _SummarizingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Formats the message in the calling thread from summarized arguments (so
+    large objects are never rendered in full) and drops records when the
+    queue is full instead of blocking.
+    """
+
+    def prepare(self, record):
+        if record.args:
+            args = record.args if isinstance(record.args, tuple) else (record.args,)
+            try:
+                record.msg = str(record.msg) % tuple(summarize(arg) for arg in args)
+            except (TypeError, ValueError):
+                record.msg = f"{record.msg} {[summarize(arg) for arg in args]}"
+            record.args = None
+        else:
+            record.msg = summarize(record.msg)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.route = _route.get()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _stats["dropped"] += 1
+
+
+def _ensure_listener():
+    """
+    Start the queue listener for this process (again after fork).
+    """
+    global _listener, _listener_pid, _queue
+    pid = os.getpid()
+    if _listener is not None and _listener_pid == pid:
+        return
+    with _lock:
+        if _listener is not None and _listener_pid == pid:
+            return
+        _queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(_JsonFormatter())
+        _listener = logging.handlers.QueueListener(_queue, stream_handler, respect_handler_level=False)
+        _listener.start()
+        _listener_pid = pid
+        root = logging.getLogger("sheets")
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_SummarizingQueueHandler(_queue))
+        root.setLevel(logging.DEBUG)
+        root.propagate = False
+
+
+class Logger:
+    """
+    Thin wrapper over a stdlib logger whose debug() honours the per-request decision.
+    """
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(f"sheets.{name}")
+
+    def debug(self, msg, *args):
+        if _debug_enabled.get():
+            _ensure_listener()
+            self._logger.debug(msg, *args)
+
+    def info(self, msg, *args):
+        if _BASE_LEVEL <= logging.INFO:
+            _ensure_listener()
+            self._logger.info(msg, *args)
+
+    def warning(self, msg, *args):
+        if _BASE_LEVEL <= logging.WARNING:
+            _ensure_listener()
+            self._logger.warning(msg, *args)
+
+    def error(self, msg, *args, exc_info=False):
+        _ensure_listener()
+        self._logger.error(msg, *args, exc_info=exc_info)
+
+    def exception(self, msg, *args):
+        self.error(msg, *args, exc_info=True)
+
+
+def get_logger(name):
+    return Logger(name)
+
+
+def _sample_rate(path):
+    for prefix, rate in _SAMPLE_RATES:
+        if path.startswith(prefix):
+            return rate
+    return LOG_SAMPLE_RATE
+
+
+def _debug_requested(headers):
+    """
+    True when the debug header carries the configured token.
+    """
+    value = headers.get(LOG_DEBUG_HEADER)
+    if not LOG_DEBUG_TOKEN or not value:
+        return False
+    return hmac.compare_digest(value.encode(), LOG_DEBUG_TOKEN.encode())
+
+
+def begin_request(path, headers):
+    """
+    Decide whether DEBUG records are kept for the current request.
+    """
+    _route.set(path)
+    if _debug_requested(headers):
+        _debug_enabled.set(True)
+    elif _BASE_LEVEL <= logging.DEBUG:
+        _debug_enabled.set(random.random() < _sample_rate(path))
+    else:
+        _debug_enabled.set(False)
+
+
+def install(app):
+    """
+    Register the per-request sampling decision on the Flask app.
+    """
+    from flask import request
+
+    @app.before_request
+    def _begin_request_logging():
+        begin_request(request.path, request.headers)
+
+
+def _stop_listener():
+    # Write out whatever is still queued when the worker exits
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+
+
+def log_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["queued"] = _queue.qsize() if _queue is not None else 0
+    return stats
@@ -0,0 +1,215 @@
+"""
+In-process metrics exposed as Prometheus text on the Flask app.
+
+Handler latency is recorded per module and endpoint by request hooks,
+upstream Sheets calls are recorded by sheets_http per operation type, and
+token, cache and logging counters are read from the helpers' *_stats()
+functions when the metrics route is scraped. Recording is a dict lookup and
+a few additions under one lock, cheap enough to leave on permanently.
+
+Metrics are per process: with several gunicorn workers each scrape reports
+the worker that served it.
+"""
+import bisect
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+# === ENVIRONMENT VARIABLES ===
+METRICS_PATH = os.environ.get("SHEETS_METRICS_PATH", "/metrics")
+# === END ENVIRONMENT VARIABLES ===
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def observe(name, labels, value):
+    """
+    Add value to the histogram name{labels}; labels is a tuple of (key, value) pairs.
+    """
+    key = (name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram()
+        histogram.observe(value)
+
+
+def increment(name, labels, amount=1):
+    key = (name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def upstream_operation(method, url):
+    """
+    Classify a Sheets API call by operation, e.g. "values.get" or "spreadsheets.batchUpdate".
+    """
+    parts = urlsplit(url)
+    path = parts.path
+    if "oauth2" in parts.netloc or path.endswith("/token"):
+        return "oauth.token"
+    if path.endswith("/values:batchGet"):
+        return "values.batchGet"
+    if path.endswith("/values:batchUpdate"):
+        return "values.batchUpdate"
+    if path.endswith(":append"):
+        return "values.append"
+    if "/values/" in path:
+        return "values.get" if method == "GET" else "values.update"
+    if path.endswith(":batchUpdate"):
+        return "spreadsheets.batchUpdate"
+    if method == "POST" and path.rstrip("/").endswith("/spreadsheets"):
+        return "spreadsheets.create"
+    return "spreadsheets.get"
+
+
+def record_upstream(method, url, status_code, elapsed, response_bytes):
+    """
+    Record one upstream call; status_code is None when the call raised.
+    """
+    operation = upstream_operation(method, url)
+    status = f"{status_code // 100}xx" if status_code else "error"
+    observe("sheets_upstream_request_duration_seconds", (("operation", operation),), elapsed)
+    increment("sheets_upstream_requests_total", (("operation", operation), ("status", status)))
+    if response_bytes:
+        increment("sheets_upstream_response_bytes_total", (("operation", operation),), response_bytes)
+
+
+def _route_labels(path):
+    segments = [segment for segment in path.strip("/").split("/") if segment]
+    endpoint = segments[-1] if segments else ""
+    module = segments[0] if len(segments) > 1 else ""
+    return (("module", module), ("endpoint", endpoint))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _helper_stats():
+    """
+    Collect the counters the shared helpers keep for themselves.
+    """
+    from src.common import (
+        app_log, sheets_auth, sheets_breaker, sheets_hedge, sheets_http, sheets_key_index, sheets_metadata, sheets_quota
+    )
+
+    http_stats = sheets_http.pool_stats()
+    token_stats = sheets_auth.token_stats()
+    metadata_stats = sheets_metadata.cache_stats()
+    index_stats = sheets_key_index.index_stats()
+    quota_stats = sheets_quota.quota_stats()
+    breaker_stats = sheets_breaker.breaker_stats()
+    hedge_stats = sheets_hedge.hedge_stats()
+    caches = {
+        "metadata": (metadata_stats["hits"], metadata_stats["misses"]),
+        "key_index": (index_stats["hits"], index_stats["builds"]),
+        "token": (token_stats["cache_hits"], token_stats["cache_misses"]),
+        "fetch_memo": (http_stats["memo_hits"], http_stats["memo_misses"]),
+    }
+    counters = {
+        "sheets_token_refreshes_total": token_stats["token_refreshes"],
+        "sheets_token_refresh_errors_total": token_stats["token_refresh_errors"],
+        "sheets_key_index_stale_total": index_stats["stale_detected"],
+        "sheets_log_dropped_total": app_log.log_stats()["dropped"],
+        "sheets_upstream_retries_total": http_stats["retries"],
+        "sheets_upstream_throttled_total": http_stats["throttled"],
+        "sheets_quota_waits_total": quota_stats["waited"],
+        "sheets_quota_wait_seconds_total": round(quota_stats["wait_seconds"], 3),
+        "sheets_quota_rejected_total": quota_stats["rejected"],
+        "sheets_breaker_opened_total": breaker_stats["opened"],
+        "sheets_breaker_rejected_total": breaker_stats["rejected"],
+        "sheets_hedged_reads_total": hedge_stats["hedged"],
+        "sheets_hedge_wins_total": hedge_stats["hedge_wins"],
+    }
+    return caches, counters
+
+
+def render():
+    """
+    Render every metric in the Prometheus text exposition format.
+    """
+    with _lock:
+        histograms = {key: (list(h.counts), h.total, h.count) for key, h in _histograms.items()}
+        counters = dict(_counters)
+    lines = []
+    seen = set()
+    for (name, labels), (counts, total, count) in sorted(histograms.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        cumulative = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', le),))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} counter")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    caches, helper_counters = _helper_stats()
+    for name, value in helper_counters.items():
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    lines.append("# TYPE sheets_cache_hits_total counter")
+    lines.extend(f'sheets_cache_hits_total{{cache="{cache}"}} {hits}' for cache, (hits, _) in caches.items())
+    lines.append("# TYPE sheets_cache_misses_total counter")
+    lines.extend(f'sheets_cache_misses_total{{cache="{cache}"}} {misses}' for cache, (_, misses) in caches.items())
+    lines.append("# TYPE sheets_cache_hit_ratio gauge")
+    for cache, (hits, misses) in caches.items():
+        ratio = hits / (hits + misses) if hits + misses else 0.0
+        lines.append(f'sheets_cache_hit_ratio{{cache="{cache}"}} {ratio:.4f}')
+    return "\n".join(lines) + "\n"
+
+
+def install(app):
+    """
+    Time every routed request per module/endpoint and serve render() at METRICS_PATH.
+    """
+    from flask import Response as FlaskResponse, g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.sheets_request_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request_latency(response):
+        started = getattr(g, "sheets_request_started", None)
+        if started is not None and request.url_rule is not None and request.path != METRICS_PATH:
+            labels = _route_labels(request.path)
+            observe("sheets_handler_duration_seconds", labels, time.perf_counter() - started)
+            increment("sheets_handler_requests_total", labels + (("status", str(response.status_code)),))
+        return response
+
+    def metrics():
+        return FlaskResponse(render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule(METRICS_PATH, "sheets_metrics", metrics, methods=["GET"])
@@ -0,0 +1,189 @@
+"""
+Opt-in per-request tracing with a timing breakdown in the response metadata.
+
+A request that sends SHEETS_TIMING_HEADER (X-Sheets-Timing: 1) is traced:
+every upstream Sheets call, synchronous token refresh and local span opened
+with span() is recorded, and the JSON response gets metadata["timing"] with
+the totals and the individual spans. Requests can also be traced without the
+header at SHEETS_TRACE_SAMPLE_RATE; they are exported but the response is
+left untouched.
+
+When SHEETS_TRACE_FILE is set, each traced request is appended to that file
+as one JSON line (trace id plus spans), for a local collector to pick up.
+
+Nothing here is edited into the handlers: install() wraps every view function
+and works off request hooks, so all modules get it. When a request is not
+traced, span() and record() cost one context-variable lookup.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+# === ENVIRONMENT VARIABLES ===
+TIMING_HEADER = os.environ.get("SHEETS_TIMING_HEADER", "X-Sheets-Timing")
+TRACE_SAMPLE_RATE = float(os.environ.get("SHEETS_TRACE_SAMPLE_RATE", "0"))
+TRACE_FILE = os.environ.get("SHEETS_TRACE_FILE", "")
+# === END ENVIRONMENT VARIABLES ===
+
+_current = contextvars.ContextVar("sheets_trace", default=None)
+_export_lock = threading.Lock()
+
+
+class Trace:
+    """
+    Spans recorded for one request. Spans may arrive from pool threads (see content_fanout).
+    """
+
+    def __init__(self, path):
+        self.trace_id = uuid.uuid4().hex
+        self.path = path
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.handler_done = None
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, name, started, duration, attributes):
+        span = {
+            "name": name,
+            "offset_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+        }
+        span.update(attributes)
+        with self.lock:
+            self.spans.append(span)
+
+    def breakdown(self, finished):
+        """
+        Summarize the trace: totals per category plus the individual spans.
+        """
+        with self.lock:
+            spans = list(self.spans)
+        handler_done = self.handler_done or finished
+        handler_ms = (handler_done - self.started) * 1000
+        upstream = [span for span in spans if span["name"] == "upstream"]
+        token_ms = sum(span["duration_ms"] for span in spans if span["name"] == "token.refresh")
+        upstream_ms = sum(span["duration_ms"] for span in upstream)
+        by_operation = {}
+        for span in upstream:
+            totals = by_operation.setdefault(span.get("operation", "unknown"), {"calls": 0, "ms": 0.0, "bytes": 0})
+            totals["calls"] += 1
+            totals["ms"] = round(totals["ms"] + span["duration_ms"], 3)
+            totals["bytes"] += span.get("bytes", 0)
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round((finished - self.started) * 1000, 3),
+            "handler_ms": round(handler_ms, 3),
+            "serialization_ms": round((finished - handler_done) * 1000, 3),
+            "upstream_ms": round(upstream_ms, 3),
+            "upstream_calls": len(upstream),
+            "upstream_bytes": sum(span.get("bytes", 0) for span in upstream),
+            "token_refresh_ms": round(token_ms, 3),
+            # Concurrent upstream calls can overlap, so this is clamped at zero
+            "local_ms": round(max(handler_ms - upstream_ms - token_ms, 0.0), 3),
+            "by_operation": by_operation,
+            "spans": spans,
+        }
+
+
+def active():
+    return _current.get() is not None
+
+
+def record(name, started, duration, **attributes):
+    """
+    Add a span that the caller has already timed with time.perf_counter().
+    """
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, started, duration, attributes)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Time the enclosed block as a span of the current trace (no-op when not tracing).
+    """
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.perf_counter() - started, attributes)
+
+
+def _export(trace, breakdown):
+    entry = {
+        "trace_id": trace.trace_id,
+        "path": trace.path,
+        "start_unix_nano": int(trace.started_at * 1e9),
+        "total_ms": breakdown["total_ms"],
+        "spans": breakdown["spans"],
+    }
+    line = json.dumps(entry, default=str) + "\n"
+    with _export_lock:
+        with open(TRACE_FILE, "a") as trace_file:
+            trace_file.write(line)
+
+
+def _timed_view(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            return view(*args, **kwargs)
+        finally:
+            trace = _current.get()
+            if trace is not None:
+                trace.handler_done = time.perf_counter()
+    wrapper._sheets_timed = True
+    return wrapper
+
+
+def install(app):
+    """
+    Register the tracing hooks on the Flask app.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _begin_trace():
+        requested = request.headers.get(TIMING_HEADER) == "1"
+        if not requested and not (TRACE_SAMPLE_RATE and random.random() < TRACE_SAMPLE_RATE):
+            g.sheets_trace = None
+            _current.set(None)
+            return
+        view = app.view_functions.get(request.endpoint)
+        if view is not None and not getattr(view, "_sheets_timed", False):
+            # Routes are registered by the modules after install(), so wrap them on first use
+            app.view_functions[request.endpoint] = _timed_view(view)
+        trace = Trace(request.path)
+        g.sheets_trace = trace
+        g.sheets_trace_requested = requested
+        _current.set(trace)
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = getattr(g, "sheets_trace", None)
+        if trace is None:
+            return response
+        _current.set(None)
+        breakdown = trace.breakdown(time.perf_counter())
+        if g.sheets_trace_requested:
+            body = response.get_json(silent=True)
+            if isinstance(body, dict):
+                if not isinstance(body.get("metadata"), dict):
+                    body["metadata"] = {}
+                body["metadata"]["timing"] = breakdown
+                response.set_data(json.dumps(body))
+        if TRACE_FILE:
+            _export(trace, breakdown)
+        return response
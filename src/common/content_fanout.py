@@ -0,0 +1,80 @@
+"""
+Resolve the content objects of one /content call concurrently.
+
+Content objects are independent of each other, so they are resolved on a
+shared, bounded thread pool and returned in the order they were requested.
+Each object gets its own timeout; an object that fails or times out comes
+back with empty data instead of failing the whole call. Rate limiting
+(sheets_http.ThrottledError) is the exception and is raised to the handler.
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from src.common import app_log, sheets_http
+
+log = app_log.get_logger(__name__)
+
+# === ENVIRONMENT VARIABLES ===
+CONTENT_WORKERS = int(os.environ.get("SHEETS_CONTENT_WORKERS", "8"))
+CONTENT_OBJECT_TIMEOUT = float(os.environ.get("SHEETS_CONTENT_OBJECT_TIMEOUT", "20"))
+# === END ENVIRONMENT VARIABLES ===
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def _get_executor():
+    """
+    Return the pool for this process, creating it on first use or after fork.
+    """
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=CONTENT_WORKERS, thread_name_prefix="content")
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def resolve_in_order(content_object_names, resolve, timeout=None):
+    """
+    Call resolve(content_name) for every requested content object and return
+    the non-None results in request order.
+
+    Each call runs in a copy of the caller's context, so request-scoped state
+    such as the sheets_http fetch memo is shared with the handler.
+    """
+    timeout = CONTENT_OBJECT_TIMEOUT if timeout is None else timeout
+    started = time.monotonic()
+    if len(content_object_names) == 1:
+        # Nothing to overlap with, so skip the hand-off to the pool
+        futures = [None]
+    else:
+        executor = _get_executor()
+        futures = [
+            executor.submit(contextvars.copy_context().run, resolve, content_name)
+            for content_name in content_object_names
+        ]
+    results = []
+    for content_name, future in zip(content_object_names, futures):
+        cid = content_name.get("id")
+        try:
+            if future is None:
+                result = resolve(content_name)
+            else:
+                result = future.result(timeout=max(started + timeout - time.monotonic(), 0))
+        except sheets_http.ThrottledError:
+            # An empty dropdown would hide the throttling, so fail the whole call
+            raise
+        except FutureTimeoutError:
+            log.warning("Content object %s timed out after %ss", cid, timeout)
+            result = {"content_object_name": cid, "data": []}
+        except Exception as e:
+            log.warning("Content object %s failed: %s", cid, e)
+            result = {"content_object_name": cid, "data": []}
+        if result is not None:
+            results.append(result)
+    return results
@@ -0,0 +1,166 @@
+"""
+Opt-in group commit for appends to the same (spreadsheet, tab).
+
+The first caller for a tab opens a batch and waits up to
+SHEETS_APPEND_BATCH_WINDOW_MS for others to join, or until the batch holds
+SHEETS_APPEND_BATCH_MAX_ROWS rows. It then appends every caller's rows with
+one flush and hands each waiting caller the slice of the written ranges that
+holds its own rows. A window of 0 (the default) disables batching.
+
+Batching needs concurrent appends inside one process, i.e. threaded gunicorn
+workers (GUNICORN_THREADS > 1). With one thread per worker there is never a
+second caller to join a batch and the window would only add delay, so the
+window is ignored (with a warning).
+"""
+import os
+import re
+import threading
+
+from src.common import app_log
+
+log = app_log.get_logger(__name__)
+
+# === ENVIRONMENT VARIABLES ===
+APPEND_BATCH_WINDOW_MS = float(os.environ.get("SHEETS_APPEND_BATCH_WINDOW_MS", "0"))
+APPEND_BATCH_MAX_ROWS = int(os.environ.get("SHEETS_APPEND_BATCH_MAX_ROWS", "1000"))
+# gunicorn_config.py exports GUNICORN_THREADS; batching needs more than one
+GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", "1"))
+# === END ENVIRONMENT VARIABLES ===
+
+_lock = threading.Lock()
+_pending = {}
+_stats = {"batches": 0, "callers": 0, "rows": 0}
+_warned = False
+
+_RANGE_PATTERN = re.compile(r"^(.*)!([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?$")
+
+
+def enabled():
+    """
+    True when a batch window is set and the worker runs more than one thread.
+    """
+    global _warned
+    if APPEND_BATCH_WINDOW_MS <= 0:
+        return False
+    if GUNICORN_THREADS <= 1:
+        if not _warned:
+            _warned = True
+            log.warning("SHEETS_APPEND_BATCH_WINDOW_MS is set but GUNICORN_THREADS=%s; append batching is off", GUNICORN_THREADS)
+        return False
+    return True
+
+
+class _Batch:
+    def __init__(self):
+        self.entries = []
+        self.row_count = 0
+        self.full = threading.Event()
+
+
+class _Entry:
+    def __init__(self, offset, rows):
+        self.offset = offset
+        self.rows = rows
+        self.done = threading.Event()
+        self.result = None
+
+
+def _slice_range(updated_range, first_offset, last_offset):
+    """
+    Narrow a chunk's updatedRange to rows first_offset..last_offset (0-based, inclusive) of the chunk.
+    """
+    match = _RANGE_PATTERN.match(updated_range or "")
+    if not match:
+        return updated_range
+    sheet_part, first_col, first_row = match.group(1), match.group(2), int(match.group(3))
+    last_col = match.group(4) or first_col
+    return f"{sheet_part}!{first_col}{first_row + first_offset}:{last_col}{first_row + last_offset}"
+
+
+def _caller_results(entry, chunk_results):
+    """
+    Return the per-chunk results covering entry's rows, or None if some of its rows were not written.
+    """
+    results = []
+    chunk_start = 0
+    entry_end = entry.offset + len(entry.rows)
+    for chunk in chunk_results:
+        chunk_end = chunk_start + chunk["rows"]
+        first, last = max(entry.offset, chunk_start), min(entry_end, chunk_end)
+        if first < last:
+            rows = entry.rows[first - entry.offset:last - entry.offset]
+            results.append({
+                "updated_range": _slice_range(chunk["updated_range"], first - chunk_start, last - 1 - chunk_start),
+                "rows": len(rows),
+                "updated_cells": sum(len(row) for row in rows)
+            })
+        chunk_start = chunk_end
+    if chunk_start < entry_end:
+        return None
+    return results
+
+
+def _flush(batch, flush):
+    all_rows = [row for entry in batch.entries for row in entry.rows]
+    try:
+        success, message, chunk_results = flush(all_rows)
+    except Exception as e:
+        success, message, chunk_results = False, f"Batched append failed: {str(e)}", []
+    with _lock:
+        _stats["batches"] += 1
+        _stats["callers"] += len(batch.entries)
+        _stats["rows"] += len(all_rows)
+    for entry in batch.entries:
+        results = _caller_results(entry, chunk_results)
+        if results is None:
+            entry.result = (False, message, [])
+        else:
+            # Earlier chunks were written even when a later one failed
+            entry.result = (
+                True,
+                f"Successfully added {len(entry.rows)} row(s) in a batch of {len(all_rows)} row(s)",
+                results
+            )
+        entry.done.set()
+
+
+def submit(key, rows, flush):
+    """
+    Queue rows for the batch of key (e.g. (spreadsheet_id, sheet_name, account))
+    and block until that batch is flushed.
+
+    flush(rows) performs the append and returns (success, message, chunk_results)
+    like append_rows_with_service_account; the return value is the same triple
+    restricted to this caller's rows.
+    """
+    with _lock:
+        batch = _pending.get(key)
+        leader = batch is None
+        if leader:
+            batch = _Batch()
+            _pending[key] = batch
+        entry = _Entry(batch.row_count, rows)
+        batch.entries.append(entry)
+        batch.row_count += len(rows)
+        if batch.row_count >= APPEND_BATCH_MAX_ROWS:
+            # Close the batch so later appends open a new one
+            del _pending[key]
+            batch.full.set()
+    if leader:
+        batch.full.wait(APPEND_BATCH_WINDOW_MS / 1000.0)
+        with _lock:
+            if _pending.get(key) is batch:
+                del _pending[key]
+        _flush(batch, flush)
+    entry.done.wait()
+    return entry.result
+
+
+def batcher_stats():
+    """
+    Report how many batches were flushed and how many callers and rows they carried.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["open_batches"] = len(_pending)
+    return stats
@@ -0,0 +1,212 @@
+"""
+asyncio client for the Sheets API, with HTTP/2 multiplexing when available.
+
+The requests session carries one call per thread. With SHEETS_ASYNC=1 and
+httpx installed (plus h2 for HTTP/2), each process runs one event loop in a
+background thread that owns an httpx.AsyncClient, and:
+
+- sheets_http sends its attempts through that client, so handler threads and
+  the content fan-out share a few multiplexed connections;
+- fan-out reads (values:batchGet chunks, read-ahead of row chunks) are sent
+  concurrently from a single handler thread with gather().
+
+request() applies the same quota, circuit breaker and retry policy as
+sheets_http.request and returns requests.Response objects, so callers
+handle both paths the same way. GETs sent with it are not memoized or hedged.
+
+The handlers stay synchronous: run() hands a coroutine to the loop and
+blocks the calling thread until it completes. Without httpx, SHEETS_ASYNC is
+ignored (with a warning) and every call stays on the requests session.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+from src.common import app_log, sheets_http
+
+log = app_log.get_logger(__name__)
+
+# === ENVIRONMENT VARIABLES ===
+ASYNC_ENABLED = os.environ.get("SHEETS_ASYNC", "0") == "1"
+ASYNC_HTTP2 = os.environ.get("SHEETS_ASYNC_HTTP2", "1") == "1"
+ASYNC_MAX_CONNECTIONS = int(os.environ.get("SHEETS_ASYNC_MAX_CONNECTIONS", "10"))
+# Calls one gather() keeps in flight at once
+ASYNC_MAX_CONCURRENCY = int(os.environ.get("SHEETS_ASYNC_MAX_CONCURRENCY", "16"))
+# Row chunks sheets_values.fetch_rows requests at once
+ASYNC_READ_AHEAD = int(os.environ.get("SHEETS_ASYNC_READ_AHEAD", "4"))
+# === END ENVIRONMENT VARIABLES ===
+
+_lock = threading.Lock()
+_loop = None
+_loop_thread = None
+_loop_pid = None
+_client = None
+_warned = False
+
+
+def enabled():
+    """
+    True when SHEETS_ASYNC is set and httpx can be imported.
+    """
+    global _warned
+    if not ASYNC_ENABLED:
+        return False
+    if not HTTPX_AVAILABLE:
+        if not _warned:
+            _warned = True
+            log.warning("SHEETS_ASYNC=1 but httpx is not installed; using the requests session")
+        return False
+    return True
+
+
+def _get_loop():
+    """
+    Return the event loop for this process, starting it on first use or after fork.
+    """
+    global _loop, _loop_thread, _loop_pid, _client
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="sheets-async", daemon=True)
+            _loop_thread.start()
+            _loop_pid = os.getpid()
+            # A client inherited across fork belongs to the parent's loop
+            _client = None
+    return _loop
+
+
+def _get_client():
+    """
+    Return the AsyncClient of this process's loop; only called on the loop thread.
+    """
+    global _client
+    if _client is None:
+        limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=ASYNC_MAX_CONNECTIONS)
+        _client = httpx.AsyncClient(http2=ASYNC_HTTP2 and H2_AVAILABLE, limits=limits)
+    return _client
+
+
+def run(coro):
+    """
+    Run coro on the process's event loop from synchronous code and return its result.
+
+    The coroutine sees the caller's context variables (request trace, log route).
+    """
+    loop = _get_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("sheets_async.run() called from the event loop thread")
+    context = contextvars.copy_context()
+    result = Future()
+
+    def settle(task):
+        if task.cancelled():
+            result.cancel()
+        elif task.exception() is not None:
+            result.set_exception(task.exception())
+        else:
+            result.set_result(task.result())
+
+    def start():
+        # Runs inside context.run, so the task starts from a copy of the caller's context
+        loop.create_task(coro).add_done_callback(settle)
+
+    loop.call_soon_threadsafe(context.run, start)
+    return result.result()
+
+
+def _to_requests_response(response):
+    """
+    Present an httpx response as a requests.Response so callers can use
+    status_code, json(), text and raise_for_status() unchanged.
+    """
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted.headers = CaseInsensitiveDict(response.headers.items())
+    converted._content = response.content
+    converted.url = str(response.url)
+    converted.reason = response.reason_phrase
+    converted.encoding = response.encoding
+    return converted
+
+
+async def send(method, url, **kwargs):
+    """
+    Send one attempt on the shared AsyncClient and record it like a
+    sheets_http attempt. Transport errors are raised as requests exceptions.
+    """
+    # requests waits indefinitely when no timeout is given; httpx would use 5s
+    kwargs.setdefault("timeout", None)
+    started = time.perf_counter()
+    try:
+        response = await _get_client().request(method, url, **kwargs)
+    except httpx.TimeoutException as e:
+        sheets_http.record_attempt(method, url, started, None, 0)
+        raise requests.Timeout(str(e)) from e
+    except httpx.TransportError as e:
+        sheets_http.record_attempt(method, url, started, None, 0)
+        raise requests.ConnectionError(str(e)) from e
+    converted = _to_requests_response(response)
+    sheets_http.record_attempt(method, url, started, converted.status_code, len(converted.content))
+    return converted
+
+
+async def request(method, url, **kwargs):
+    """
+    Async counterpart of sheets_http.request: same quota, circuit breaker and
+    retry policy, waiting with asyncio.sleep instead of blocking a thread.
+    """
+    target = sheets_http.call_target(method, url, kwargs.get("params"), kwargs.get("headers"))
+    attempt = 0
+    while True:
+        wait = sheets_http.admit(target)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        try:
+            response = await send(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            delay = sheets_http.error_delay(method, target, attempt)
+            if delay is None:
+                raise
+        else:
+            delay = sheets_http.retry_delay(method, target, response, attempt)
+            if delay is None:
+                return response
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+async def get(url, **kwargs):
+    return await request("GET", url, **kwargs)
+
+
+async def gather(calls, limit=None):
+    """
+    Await the coroutines in calls with at most limit (ASYNC_MAX_CONCURRENCY)
+    in flight and return their results in order. The first failure is raised.
+    """
+    semaphore = asyncio.Semaphore(limit or ASYNC_MAX_CONCURRENCY)
+
+    async def bounded(call):
+        async with semaphore:
+            return await call
+
+    return await asyncio.gather(*(bounded(call) for call in calls))
@@ -0,0 +1,167 @@
+"""
+Process-wide service account credentials manager.
+
+GOOGLE_SERVICE_ACCOUNT_JSON is parsed once per process and access tokens are
+cached per scope set. A background thread refreshes tokens before they expire,
+so write requests normally find a valid token already in memory.
+"""
+import datetime
+import json
+import os
+import threading
+import time
+
+from src.common import app_log, app_trace, sheets_http
+
+log = app_log.get_logger(__name__)
+
+# === ENVIRONMENT VARIABLES ===
+SERVICE_ACCOUNT_JSON_STR = os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON")
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = int(os.environ.get("SHEETS_TOKEN_REFRESH_MARGIN", "300"))
+# How often the background refresher wakes up to look for expiring tokens
+TOKEN_REFRESH_INTERVAL = int(os.environ.get("SHEETS_TOKEN_REFRESH_INTERVAL", "60"))
+# === END ENVIRONMENT VARIABLES ===
+
+SPREADSHEETS_SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+_lock = threading.RLock()
+_account_info = None
+_credentials = {}
+# Current access token -> (project_id, client_email), for sheets_quota
+_token_accounts = {}
+_refresher = None
+_owner_pid = None
+_stats = {"token_refreshes": 0, "token_refresh_errors": 0, "cache_hits": 0, "cache_misses": 0}
+
+
+def _reset_after_fork():
+    """
+    Forget everything inherited from the parent; threads do not survive fork.
+    """
+    global _lock, _credentials, _token_accounts, _refresher, _owner_pid
+    _lock = threading.RLock()
+    _credentials = {}
+    _token_accounts = {}
+    _refresher = None
+    _owner_pid = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _load_account_info(service_account_json=None):
+    """
+    Return the parsed service account info, parsing the env JSON at most once.
+    """
+    global _account_info
+    if service_account_json is not None:
+        if isinstance(service_account_json, str):
+            return json.loads(service_account_json)
+        return service_account_json
+    if _account_info is None and SERVICE_ACCOUNT_JSON_STR:
+        _account_info = json.loads(SERVICE_ACCOUNT_JSON_STR)
+    return _account_info
+
+
+def _cache_key(account_info, scopes):
+    return (account_info.get("client_email", ""), tuple(sorted(set(scopes))))
+
+
+def _expires_soon(creds, margin):
+    if not creds.token or creds.expiry is None:
+        return True
+    # google-auth stores expiry as a naive UTC datetime
+    now = datetime.datetime.utcnow()
+    return (creds.expiry - now).total_seconds() <= margin
+
+
+def _refresh(creds):
+    # Import inside function to avoid PyO3 re-init error
+    from google.auth.transport.requests import Request as GoogleRequest
+    old_token = creds.token
+    try:
+        # Only traced when refreshed inside a request, not by the background refresher
+        with app_trace.span("token.refresh"):
+            creds.refresh(GoogleRequest(session=sheets_http.get_session()))
+        _stats["token_refreshes"] += 1
+    except Exception:
+        _stats["token_refresh_errors"] += 1
+        raise
+    with _lock:
+        _token_accounts.pop(old_token, None)
+        _token_accounts[creds.token] = (getattr(creds, "project_id", None), creds.service_account_email)
+
+
+def _refresh_loop():
+    while True:
+        time.sleep(TOKEN_REFRESH_INTERVAL)
+        with _lock:
+            cached = list(_credentials.values())
+        for creds in cached:
+            if _expires_soon(creds, TOKEN_REFRESH_MARGIN + TOKEN_REFRESH_INTERVAL):
+                try:
+                    _refresh(creds)
+                except Exception as e:
+                    log.warning("Background token refresh failed: %s", e)
+
+
+def _ensure_refresher():
+    global _refresher, _owner_pid
+    if _refresher is not None and _owner_pid == os.getpid():
+        return
+    _refresher = threading.Thread(target=_refresh_loop, name="sheets-token-refresher", daemon=True)
+    _owner_pid = os.getpid()
+    _refresher.start()
+
+
+def get_credentials(scopes=None, service_account_json=None):
+    """
+    Return cached service account credentials holding a valid access token.
+    Returns None when no service account JSON is configured.
+    """
+    scopes = scopes or SPREADSHEETS_SCOPES
+    account_info = _load_account_info(service_account_json)
+    if not account_info:
+        return None
+    key = _cache_key(account_info, scopes)
+    with _lock:
+        creds = _credentials.get(key)
+        if creds is None:
+            # Import inside function to avoid PyO3 re-init error
+            from google.oauth2 import service_account
+            creds = service_account.Credentials.from_service_account_info(account_info, scopes=list(key[1]))
+            _credentials[key] = creds
+        _ensure_refresher()
+        if _expires_soon(creds, 0):
+            _stats["cache_misses"] += 1
+            _refresh(creds)
+        else:
+            _stats["cache_hits"] += 1
+    return creds
+
+
+def get_access_token(scopes=None, service_account_json=None):
+    """
+    Return a bearer token for the given scopes, minting one only when the cache is cold.
+    """
+    creds = get_credentials(scopes, service_account_json)
+    return creds.token if creds else None
+
+
+def account_for_token(token):
+    """
+    Return (project_id, client_email) of the service account a cached access
+    token belongs to, or None for tokens this process did not mint.
+    """
+    return _token_accounts.get(token)
+
+
+def token_stats():
+    """
+    Report token refresh and cache counters for this process.
+    """
+    stats = dict(_stats)
+    stats["cached_scope_sets"] = len(_credentials)
+    return stats
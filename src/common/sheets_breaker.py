@@ -0,0 +1,99 @@
+"""
+Per-spreadsheet circuit breaker for upstream Sheets calls.
+
+After SHEETS_BREAKER_FAILURES consecutive failed calls (connection errors,
+timeouts or 5xx answers) on one spreadsheet the breaker opens, and calls to
+that spreadsheet fail immediately instead of holding a gunicorn worker for
+the full upstream timeout. After SHEETS_BREAKER_RESET seconds a single probe
+call is let through: success closes the breaker, failure opens it again.
+
+A failure threshold of 0 disables the breaker.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# === ENVIRONMENT VARIABLES ===
+BREAKER_FAILURES = int(os.environ.get("SHEETS_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.environ.get("SHEETS_BREAKER_RESET", "30"))
+# === END ENVIRONMENT VARIABLES ===
+
+BREAKERS = 1024
+
+_lock = threading.Lock()
+_breakers = OrderedDict()
+_stats = {"opened": 0, "rejected": 0, "probes": 0}
+
+
+class _Breaker:
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+
+
+def _get(key):
+    breaker = _breakers.get(key)
+    if breaker is None:
+        breaker = _breakers[key] = _Breaker()
+        while len(_breakers) > BREAKERS:
+            _breakers.popitem(last=False)
+    else:
+        _breakers.move_to_end(key)
+    return breaker
+
+
+def allow(spreadsheet_id):
+    """
+    Return True if a call to spreadsheet_id may be sent now.
+    """
+    if BREAKER_FAILURES <= 0:
+        return True
+    now = time.monotonic()
+    with _lock:
+        breaker = _get(spreadsheet_id)
+        if breaker.opened_at is None:
+            return True
+        if now - breaker.opened_at < BREAKER_RESET:
+            _stats["rejected"] += 1
+            return False
+        # Half-open: one probe at a time; a probe that never reported back is replaced after BREAKER_RESET
+        if breaker.probe_started is not None and now - breaker.probe_started < BREAKER_RESET:
+            _stats["rejected"] += 1
+            return False
+        breaker.probe_started = now
+        _stats["probes"] += 1
+        return True
+
+
+def record_success(spreadsheet_id):
+    if BREAKER_FAILURES <= 0:
+        return
+    with _lock:
+        breaker = _get(spreadsheet_id)
+        breaker.failures = 0
+        breaker.opened_at = None
+        breaker.probe_started = None
+
+
+def record_failure(spreadsheet_id):
+    if BREAKER_FAILURES <= 0:
+        return
+    with _lock:
+        breaker = _get(spreadsheet_id)
+        breaker.failures += 1
+        if breaker.probe_started is not None or (breaker.opened_at is None and breaker.failures >= BREAKER_FAILURES):
+            breaker.opened_at = time.monotonic()
+            breaker.probe_started = None
+            _stats["opened"] += 1
+
+
+def breaker_stats():
+    """
+    Report how often breakers opened and rejected calls, and how many are open now.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["open"] = sum(1 for breaker in _breakers.values() if breaker.opened_at is not None)
+    return stats
@@ -0,0 +1,254 @@
+"""
+Compile the filters array of filter_google_sheets_data into a single row predicate.
+
+Each filter is a column/operator/value triple. Column indexes, operator
+functions and numeric comparison values are resolved once at compile time,
+so evaluating a row is a handful of tuple lookups and comparisons.
+
+Grouping: filters that share a "group" label are combined with AND and the
+groups are combined with OR. Filters without a group all land in one AND
+group when logic is "AND", or each form their own group when logic is "OR".
+
+filter_indexed_rows_columnar is an optional NumPy-backed evaluator that
+converts each referenced column once into a float array plus a numeric mask
+and evaluates the comparisons as vectorized operations. It returns exactly
+the rows filter_indexed_rows returns.
+"""
+import operator as op
+from collections import OrderedDict
+
+from src.common import app_trace
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+OPERATORS = {
+    "=": op.eq,
+    "!=": op.ne,
+    ">": op.gt,
+    "<": op.lt,
+    ">=": op.ge,
+    "<=": op.le,
+}
+
+
+def option_value(obj):
+    """
+    Unwrap a dropdown value ({"id", "label", "value"}) to its plain value.
+    """
+    if isinstance(obj, dict):
+        return obj.get("id") or obj.get("label") or obj.get("value")
+    return obj
+
+
+def to_number(value):
+    """
+    Return float(value), or None when the value is not numeric.
+    """
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def resolve_filter(filter_obj, headers):
+    """
+    Return (col_idx, operator_id, value) for a filter, or None if the filter
+    names no column/operator or a column missing from headers (it is ignored).
+    """
+    if not filter_obj:
+        return None
+    # Support both 'column' and 'column_name' keys
+    column_name = option_value(filter_obj.get("column") or filter_obj.get("column_name"))
+    operator_id = option_value(filter_obj.get("operator"))
+    if not column_name or not operator_id:
+        return None
+    if column_name not in headers:
+        return None
+    return headers.index(column_name), operator_id, filter_obj.get("value")
+
+
+def compile_filter(filter_obj, headers):
+    """
+    Compile one filter into predicate(row) -> bool, or None if the filter is ignored.
+
+    Cells are compared numerically when both the cell and the filter value parse
+    as numbers, and as strings otherwise. Unknown operators match nothing.
+    """
+    resolved = resolve_filter(filter_obj, headers)
+    if resolved is None:
+        return None
+    col_idx, operator_id, value = resolved
+    compare = OPERATORS.get(operator_id)
+    if compare is None:
+        return lambda row: False
+    value_str = str(value)
+    value_num = to_number(value)
+
+    if value_num is None:
+        # The filter value is not numeric, so every comparison is a string comparison
+        def predicate(row):
+            cell = row[col_idx] if col_idx < len(row) else ""
+            return compare(str(cell), value_str)
+        return predicate
+
+    def predicate(row):
+        cell = row[col_idx] if col_idx < len(row) else ""
+        try:
+            return compare(float(cell), value_num)
+        except (ValueError, TypeError):
+            return compare(str(cell), value_str)
+    return predicate
+
+
+def group_filters(filters, logic="AND"):
+    """
+    Split filters into OR-ed groups of AND-ed filters (see module docstring).
+    """
+    or_logic = str(option_value(logic) or "AND").upper() == "OR"
+    groups = OrderedDict()
+    for position, filter_obj in enumerate(filters or []):
+        group = (filter_obj or {}).get("group")
+        if group in (None, ""):
+            group = ("position", position) if or_logic else ("default",)
+        groups.setdefault(group, []).append(filter_obj)
+    return list(groups.values())
+
+
+def compile_filters(filters, headers, logic="AND"):
+    """
+    Compile the whole filters array into predicate(row) -> bool.
+    """
+    compiled_groups = []
+    for group in group_filters(filters, logic):
+        predicates = [p for p in (compile_filter(f, headers) for f in group) if p is not None]
+        if not predicates:
+            # Every filter in the group is ignored, so the group matches all rows
+            return lambda row: True
+        compiled_groups.append(predicates)
+
+    if not compiled_groups:
+        return lambda row: True
+    if len(compiled_groups) == 1:
+        predicates = compiled_groups[0]
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda row: all(p(row) for p in predicates)
+    return lambda row: any(all(p(row) for p in predicates) for predicates in compiled_groups)
+
+
+def filter_indexed_rows(indexed_rows, headers, filters, logic="AND"):
+    """
+    Keep the (row_number, row) pairs whose row matches the compiled filters.
+    """
+    with app_trace.span("filter.rows", rows=len(indexed_rows)):
+        predicate = compile_filters(filters, headers, logic)
+        return [(row_number, row) for row_number, row in indexed_rows if predicate(row)]
+
+
+def _float_or_nan(cell):
+    try:
+        return float(cell)
+    except (ValueError, TypeError):
+        return float("nan")
+
+
+class _Column:
+    """
+    One sheet column converted lazily into the arrays the columnar evaluator needs.
+    """
+
+    def __init__(self, rows, col_idx):
+        self.cells = [row[col_idx] if col_idx < len(row) else "" for row in rows]
+        self._objects = None
+        self._numeric = None
+
+    def objects(self):
+        # Object dtype keeps Python str comparison semantics
+        if self._objects is None:
+            self._objects = np.array([str(cell) for cell in self.cells], dtype=object)
+        return self._objects
+
+    def numeric(self):
+        """
+        Return (values, is_numeric): float64 values and a mask of cells that parse as numbers.
+        """
+        if self._numeric is None:
+            cells = self.cells
+            try:
+                # Fast path: every cell is numeric (NumPy parses str with float())
+                values = np.array(cells, dtype=np.float64)
+                self._numeric = (values, np.ones(len(cells), dtype=bool))
+                return self._numeric
+            except (ValueError, TypeError):
+                pass
+            values = np.fromiter(map(_float_or_nan, cells), dtype=np.float64, count=len(cells))
+            is_numeric = ~np.isnan(values)
+            # NaN marks unparsable cells, except for cells that really are "nan"
+            for i in np.flatnonzero(~is_numeric).tolist():
+                if to_number(cells[i]) is not None:
+                    is_numeric[i] = True
+            self._numeric = (values, is_numeric)
+        return self._numeric
+
+
+def _columnar_mask(column, operator_id, value, row_count):
+    compare = OPERATORS.get(operator_id)
+    if compare is None:
+        return np.zeros(row_count, dtype=bool)
+    value_str = str(value)
+    value_num = to_number(value)
+    if value_num is None:
+        return np.asarray(compare(column.objects(), value_str), dtype=bool)
+    values, is_numeric = column.numeric()
+    with np.errstate(invalid="ignore"):
+        mask = np.asarray(compare(values, value_num), dtype=bool) & is_numeric
+    # Cells that are not numbers fall back to a string comparison, as in the row-wise path
+    fallback = np.flatnonzero(~is_numeric)
+    if fallback.size:
+        cells = column.cells
+        mask[fallback] = [compare(str(cells[i]), value_str) for i in fallback.tolist()]
+    return mask
+
+
+def columnar_mask(rows, headers, filters, logic="AND"):
+    """
+    Evaluate the filters over rows and return a NumPy boolean mask (one entry per row).
+    """
+    row_count = len(rows)
+    columns = {}
+    total = np.zeros(row_count, dtype=bool)
+    for group in group_filters(filters, logic):
+        group_mask = None
+        for filter_obj in group:
+            resolved = resolve_filter(filter_obj, headers)
+            if resolved is None:
+                continue
+            col_idx, operator_id, value = resolved
+            if col_idx not in columns:
+                columns[col_idx] = _Column(rows, col_idx)
+            mask = _columnar_mask(columns[col_idx], operator_id, value, row_count)
+            group_mask = mask if group_mask is None else group_mask & mask
+        if group_mask is None:
+            # Every filter in the group is ignored, so the group matches all rows
+            return np.ones(row_count, dtype=bool)
+        total |= group_mask
+    if not filters:
+        return np.ones(row_count, dtype=bool)
+    return total
+
+
+def filter_indexed_rows_columnar(indexed_rows, headers, filters, logic="AND"):
+    """
+    Columnar equivalent of filter_indexed_rows. Falls back to the row-wise
+    path when NumPy is not installed.
+    """
+    if not NUMPY_AVAILABLE:
+        return filter_indexed_rows(indexed_rows, headers, filters, logic)
+    with app_trace.span("filter.columnar", rows=len(indexed_rows)):
+        mask = columnar_mask([row for _, row in indexed_rows], headers, filters, logic)
+        return [indexed_rows[i] for i in np.flatnonzero(mask).tolist()]
@@ -0,0 +1,108 @@
+"""
+Opt-in hedged reads for idempotent GETs.
+
+sheets_http keeps a window of recent latencies per operation (values.get,
+values.batchGet, spreadsheets.get, ...). With SHEETS_HEDGE_READS=1, a GET
+that has not answered within its operation's p95 gets a second, identical
+attempt and whichever answers first is used. The slower attempt finishes in
+the background and is discarded. At most one extra call is sent per GET and
+only for the slowest ~5%, and only once the operation has
+HEDGE_MIN_SAMPLES latencies to estimate the p95 from.
+"""
+import contextvars
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# === ENVIRONMENT VARIABLES ===
+HEDGE_READS = os.environ.get("SHEETS_HEDGE_READS", "0") == "1"
+HEDGE_MIN_DELAY = float(os.environ.get("SHEETS_HEDGE_MIN_DELAY", "0.05"))
+HEDGE_WORKERS = int(os.environ.get("SHEETS_HEDGE_WORKERS", "16"))
+# === END ENVIRONMENT VARIABLES ===
+
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+HEDGE_PERCENTILE = 0.95
+
+_lock = threading.Lock()
+_latencies = {}
+_executor = None
+_executor_pid = None
+_stats = {"hedged": 0, "hedge_wins": 0}
+
+
+def _get_executor():
+    """
+    Return the pool for this process, creating it on first use or after fork.
+    """
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def observe(operation, elapsed):
+    """
+    Add the latency of a successful call to the operation's window.
+    """
+    with _lock:
+        window = _latencies.get(operation)
+        if window is None:
+            window = _latencies[operation] = deque(maxlen=HEDGE_WINDOW)
+        window.append(elapsed)
+
+
+def hedge_delay(operation):
+    """
+    Return the p95 latency of the operation (at least HEDGE_MIN_DELAY), or None
+    while there are too few samples to hedge on.
+    """
+    with _lock:
+        window = _latencies.get(operation)
+        if window is None or len(window) < HEDGE_MIN_SAMPLES:
+            return None
+        samples = sorted(window)
+    return max(samples[int(len(samples) * HEDGE_PERCENTILE) - 1], HEDGE_MIN_DELAY)
+
+
+def run(send, delay, may_hedge):
+    """
+    Call send() and, if it has not finished after delay seconds and
+    may_hedge() agrees, call it a second time. Returns the result of the first
+    attempt to finish; an exception is raised only if both attempts fail.
+    """
+    executor = _get_executor()
+    first = executor.submit(contextvars.copy_context().run, send)
+    done, _ = wait([first], timeout=delay)
+    if done or not may_hedge():
+        return first.result()
+    second = executor.submit(contextvars.copy_context().run, send)
+    with _lock:
+        _stats["hedged"] += 1
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    with _lock:
+                        _stats["hedge_wins"] += 1
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def hedge_stats():
+    """
+    Report how many reads were hedged and how often the hedge answered first.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["operations"] = {
+            operation: len(window) for operation, window in _latencies.items()
+        }
+    return stats
@@ -0,0 +1,436 @@
+"""
+Process-wide HTTP client for sheets.googleapis.com.
+
+Every module goes through the session returned by get_session() so that
+upstream calls reuse keep-alive connections instead of paying a fresh
+TCP+TLS handshake per request. The session is rebuilt lazily in each
+gunicorn worker after fork.
+
+Handlers wrapped with request_scoped_fetches() also memoize their GETs by
+URL and query parameters, so each distinct read is sent at most once per
+call even when several content objects need the same header or metadata.
+
+Calls wait for a token from the sheets_quota buckets before they are sent,
+and 429/5xx answers are retried with jittered exponential backoff that
+honours Retry-After. A call that stays rate limited raises ThrottledError,
+so callers never mistake a throttled read for an empty sheet.
+
+A per-spreadsheet circuit breaker (sheets_breaker) fails calls fast with
+CircuitOpenError while a spreadsheet keeps erroring or timing out, and GETs
+can be hedged past their p95 latency (sheets_hedge).
+
+With SHEETS_ASYNC=1 the attempts go through the asyncio client in
+sheets_async instead of the requests session (see that module).
+"""
+import contextvars
+import email.utils
+import functools
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.common import app_metrics, app_trace, sheets_async, sheets_breaker, sheets_hedge, sheets_quota
+
+# === ENVIRONMENT VARIABLES ===
+# gunicorn_config.py exports GUNICORN_THREADS so each worker can size its pool
+GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", "1"))
+# Threads of the /content fan-out pool (content_fanout, which imports this module)
+CONTENT_WORKERS = int(os.environ.get("SHEETS_CONTENT_WORKERS", "8"))
+POOL_CONNECTIONS = int(os.environ.get("SHEETS_HTTP_POOL_CONNECTIONS", "4"))
+# Enough keep-alive connections for every thread that can call at once: the
+# handler threads, the content fan-out pool and, when hedging, the hedge pool
+POOL_MAXSIZE = int(os.environ.get("SHEETS_HTTP_POOL_MAXSIZE", str(
+    max(GUNICORN_THREADS, 1) + CONTENT_WORKERS + (sheets_hedge.HEDGE_WORKERS if sheets_hedge.HEDGE_READS else 0)
+)))
+HTTP_MAX_RETRIES = int(os.environ.get("SHEETS_HTTP_MAX_RETRIES", "5"))
+HTTP_BACKOFF_BASE = float(os.environ.get("SHEETS_HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.environ.get("SHEETS_HTTP_BACKOFF_MAX", "32"))
+# === END ENVIRONMENT VARIABLES ===
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# The API applies these idempotently, so they are also retried after a 5xx or a lost connection
+IDEMPOTENT_METHODS = ("GET", "PUT")
+
+_SPREADSHEET_PATTERN = re.compile(r"/v4/spreadsheets(?:/([^/:?]+))?")
+_KEY_PATTERN = re.compile(r"[?&]key=([^&]+)")
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+_stats = {
+    "sessions_created": 0, "requests": 0, "errors": 0, "retries": 0, "throttled": 0, "circuit_open": 0,
+    "memo_hits": 0, "memo_misses": 0,
+}
+_fetch_memo = contextvars.ContextVar("sheets_fetch_memo", default=None)
+
+
+def _build_session():
+    """
+    Create a session whose adapters keep POOL_MAXSIZE connections alive per host.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        pool_block=False,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Return the shared session for this process, creating it on first use
+    or after the process has been forked.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _lock:
+        if _session is None or _session_pid != pid:
+            _session = _build_session()
+            _session_pid = pid
+            _stats["sessions_created"] += 1
+    return _session
+
+
+def reset_session():
+    """
+    Drop the shared session. The next call to get_session() builds a new one.
+    """
+    global _session, _session_pid, _lock
+    # The lock may have been held by another thread at fork time
+    _lock = threading.Lock()
+    _session = None
+    _session_pid = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_session)
+
+
+class ThrottledError(requests.HTTPError):
+    """
+    The Sheets API kept answering 429, or the quota had no token for the call in time.
+    """
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    The spreadsheet's circuit breaker is open, so the call was not sent.
+    """
+
+
+def record_attempt(method, url, started, status_code, response_bytes):
+    """
+    Record one attempt in the counters, the metrics, the request trace and the
+    hedging latency window; status_code is None when the attempt raised.
+    """
+    elapsed = time.perf_counter() - started
+    _stats["requests"] += 1
+    if status_code is None:
+        _stats["errors"] += 1
+    app_metrics.record_upstream(method, url, status_code, elapsed, response_bytes)
+    if sheets_hedge.HEDGE_READS and method == "GET" and status_code == 200:
+        sheets_hedge.observe(app_metrics.upstream_operation(method, url), elapsed)
+    if app_trace.active():
+        app_trace.record(
+            "upstream", started, elapsed,
+            operation=app_metrics.upstream_operation(method, url),
+            status=status_code,
+            bytes=response_bytes,
+        )
+
+
+def _send(method, url, **kwargs):
+    """
+    Send one attempt through the shared session and record it.
+    """
+    if sheets_async.enabled():
+        # Blocking callers share the event loop's multiplexed connections
+        return sheets_async.run(sheets_async.send(method, url, **kwargs))
+    started = time.perf_counter()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except requests.RequestException:
+        record_attempt(method, url, started, None, 0)
+        raise
+    record_attempt(method, url, started, response.status_code, len(response.content))
+    return response
+
+
+def _retry_after(response):
+    """
+    Seconds requested by a Retry-After header (delta-seconds or HTTP date), or None.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    # Full jitter: concurrent callers that failed together do not retry together
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def _credential(url, params, headers):
+    """
+    Return the (project, user) pair sheets_quota keys its buckets on: the API
+    key for keyed calls, the service account behind a bearer token, or None.
+    """
+    items = params.items() if isinstance(params, dict) else params if isinstance(params, (list, tuple)) else []
+    api_key = next((value for name, value in items if name == "key"), None)
+    if api_key is None:
+        match = _KEY_PATTERN.search(url)
+        api_key = match.group(1) if match else None
+    if api_key:
+        return api_key, api_key
+    authorization = (headers or {}).get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        # Imported here because sheets_auth imports this module
+        from src.common import sheets_auth
+        return sheets_auth.account_for_token(authorization[len("Bearer "):])
+    return None
+
+
+def call_target(method, url, params=None, headers=None):
+    """
+    Return (kind, spreadsheet_id, credential) of a call for the quota buckets
+    and circuit breaker, or None for URLs outside /v4/spreadsheets.
+    """
+    match = _SPREADSHEET_PATTERN.search(url)
+    if not match:
+        return None
+    return ("read" if method == "GET" else "write"), match.group(1), _credential(url, params, headers)
+
+
+def admit(target):
+    """
+    Check the circuit breaker and take a quota token for target. Returns the
+    seconds to wait before sending; raises CircuitOpenError or ThrottledError.
+    """
+    if target is None:
+        return 0.0
+    kind, spreadsheet_id, credential = target
+    if not sheets_breaker.allow(spreadsheet_id or ""):
+        _stats["circuit_open"] += 1
+        raise CircuitOpenError(f"Google Sheets calls for spreadsheet {spreadsheet_id} are failing; retry later")
+    wait = sheets_quota.reserve(kind, credential)
+    if wait is None:
+        _stats["throttled"] += 1
+        raise ThrottledError(f"Google Sheets {kind} quota exhausted for spreadsheet {spreadsheet_id}")
+    return wait
+
+
+def retry_delay(method, target, response, attempt):
+    """
+    Record an answer with the circuit breaker and return the seconds to wait
+    before retrying it, or None when it should be returned to the caller.
+    Raises ThrottledError when a 429 is not retried again.
+    """
+    status = response.status_code
+    if target is not None:
+        if status >= 500:
+            sheets_breaker.record_failure(target[1] or "")
+        else:
+            sheets_breaker.record_success(target[1] or "")
+    if status not in RETRY_STATUSES or (status != 429 and method not in IDEMPOTENT_METHODS):
+        return None
+    delay = max(_backoff(attempt), _retry_after(response) or 0.0)
+    if status == 429 and target is not None:
+        sheets_quota.throttle(target[0], target[2], delay)
+    if attempt >= HTTP_MAX_RETRIES or delay > sheets_quota.QUOTA_MAX_WAIT:
+        if status != 429:
+            return None
+        _stats["throttled"] += 1
+        raise ThrottledError(
+            f"Google Sheets rate limit still exceeded after {attempt + 1} attempt(s)",
+            response=response
+        )
+    _stats["retries"] += 1
+    return delay
+
+
+def error_delay(method, target, attempt):
+    """
+    Record a connection error or timeout with the circuit breaker and return
+    the seconds to wait before retrying, or None when it should be raised.
+    """
+    if target is not None:
+        sheets_breaker.record_failure(target[1] or "")
+    if method not in IDEMPOTENT_METHODS or attempt >= HTTP_MAX_RETRIES:
+        return None
+    _stats["retries"] += 1
+    return _backoff(attempt)
+
+
+def _attempt(method, url, target, **kwargs):
+    """
+    Send one attempt, hedged past the operation's p95 when hedging is on and the method is GET.
+    """
+    if not sheets_hedge.HEDGE_READS or method != "GET":
+        return _send(method, url, **kwargs)
+    delay = sheets_hedge.hedge_delay(app_metrics.upstream_operation(method, url))
+    if delay is None:
+        return _send(method, url, **kwargs)
+    # The hedge needs its own quota token but never waits for one
+    return sheets_hedge.run(
+        lambda: _send(method, url, **kwargs),
+        delay,
+        lambda: target is None or sheets_quota.reserve(target[0], target[2], max_wait=0) is not None
+    )
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request through the shared session, within the Sheets quota.
+
+    429 answers are retried for every method; 5xx answers and connection
+    errors only for IDEMPOTENT_METHODS, since a retried append or batchUpdate
+    could be applied twice. Retries wait a jittered exponential backoff, or
+    the Retry-After delay when that is longer. Raises ThrottledError when the
+    call is still rate limited after HTTP_MAX_RETRIES retries; other error
+    responses are returned to the caller as before.
+
+    Connection errors, timeouts and 5xx answers count against the
+    spreadsheet's circuit breaker; while it is open CircuitOpenError is
+    raised without sending anything.
+    """
+    target = call_target(method, url, kwargs.get("params"), kwargs.get("headers"))
+    attempt = 0
+    while True:
+        wait = admit(target)
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            response = _attempt(method, url, target, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            delay = error_delay(method, target, attempt)
+            if delay is None:
+                raise
+        else:
+            delay = retry_delay(method, target, response, attempt)
+            if delay is None:
+                return response
+        attempt += 1
+        time.sleep(delay)
+
+
+class _FetchMemo:
+    """
+    GET responses of one handler call, keyed by URL and query parameters.
+    Concurrent lookups of the same key wait for the first one instead of sending a duplicate.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, key, fetch):
+        with self.lock:
+            entry = self.entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = {"done": threading.Event(), "response": None}
+                self.entries[key] = entry
+                _stats["memo_misses"] += 1
+        if not owner:
+            entry["done"].wait()
+            if entry["response"] is not None:
+                _stats["memo_hits"] += 1
+                return entry["response"]
+            return fetch()
+        try:
+            entry["response"] = fetch()
+            return entry["response"]
+        except Exception:
+            # Failures are not memoized; a later caller sends its own request
+            with self.lock:
+                self.entries.pop(key, None)
+            raise
+        finally:
+            entry["done"].set()
+
+
+def _memo_key(url, params):
+    if params is None:
+        return url, ()
+    items = params.items() if isinstance(params, dict) else params
+    return url, tuple((str(name), str(value)) for name, value in items)
+
+
+def request_scoped_fetches(handler):
+    """
+    Decorate a route handler so that its GETs are memoized for the duration of one call.
+    """
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        if _fetch_memo.get() is not None:
+            return handler(*args, **kwargs)
+        token = _fetch_memo.set(_FetchMemo())
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            _fetch_memo.reset(token)
+    return wrapper
+
+
+def get(url, **kwargs):
+    memo = _fetch_memo.get()
+    if memo is None:
+        return request("GET", url, **kwargs)
+    return memo.get(_memo_key(url, kwargs.get("params")), lambda: request("GET", url, **kwargs))
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
+
+
+def pool_stats():
+    """
+    Report request counters and per-host connection pool usage for this process.
+    """
+    stats = dict(_stats)
+    stats["pid"] = os.getpid()
+    stats["pool_connections"] = POOL_CONNECTIONS
+    stats["pool_maxsize"] = POOL_MAXSIZE
+    pools = []
+    session = _session if _session_pid == os.getpid() else None
+    if session is not None:
+        seen = set()
+        for adapter in session.adapters.values():
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            pool_manager = adapter.poolmanager
+            for key in list(pool_manager.pools.keys()):
+                pool = pool_manager.pools.get(key)
+                if pool is None:
+                    continue
+                pools.append({
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "connections_opened": pool.num_connections,
+                    "requests_sent": pool.num_requests,
+                    "idle_connections": pool.pool.qsize() if pool.pool is not None else 0,
+                })
+    stats["pools"] = pools
+    return stats
@@ -0,0 +1,271 @@
+"""
+In-process key -> row-number index per (spreadsheet, tab, key column).
+
+An index is built lazily from two small reads (the header row and the key
+column) and then answers key lookups from memory. Our own appends, updates
+and deletes are applied to it incrementally. Before update/delete act on a
+cached index, find_rows() checks it with one small values:batchGet
+(check_index()): the header, the key cells of the matched rows, and the key
+column below the last row the index knows. Keys appended since the build
+(by another worker or by hand) are picked up from that tail read; a changed
+header or matched cell invalidates every index for the tab. What the check
+cannot see is a key changed to the looked-up value by someone else above the
+tail; such rows are found at the latest when the index expires after
+SHEETS_KEY_INDEX_TTL seconds.
+
+The distinct keys of an index also back the paged, searchable key_values
+dropdowns (distinct_values()).
+"""
+import bisect
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from src.common import sheets_ranges, sheets_values
+
+# === ENVIRONMENT VARIABLES ===
+KEY_INDEX_TTL = float(os.environ.get("SHEETS_KEY_INDEX_TTL", "300"))
+KEY_INDEX_CACHE_SIZE = int(os.environ.get("SHEETS_KEY_INDEX_CACHE_SIZE", "64"))
+DISTINCT_PAGE_SIZE = int(os.environ.get("SHEETS_KEY_VALUES_PAGE_SIZE", "100"))
+# === END ENVIRONMENT VARIABLES ===
+
+_lock = threading.RLock()
+_indexes = OrderedDict()
+_stats = {"hits": 0, "builds": 0, "invalidations": 0, "stale_detected": 0}
+
+
+class KeyIndex:
+    """
+    Maps each non-blank value of one key column to the ascending sheet row numbers holding it.
+    """
+
+    def __init__(self, header, key_col_idx, key_cells):
+        self.header = header
+        self.key_col_idx = key_col_idx
+        self.expires_at = time.monotonic() + KEY_INDEX_TTL
+        self.rows = {}
+        self.value_by_row = {}
+        # Last row read from the sheet; check_index() reads the key column below it
+        self.last_row = len(key_cells) + 1
+        for row_number, value in enumerate(key_cells, start=2):
+            self.set(row_number, value)
+
+    def lookup(self, key_value):
+        return list(self.rows.get(key_value, []))
+
+    def set(self, row_number, value):
+        """
+        Record that row_number now holds value ("" clears it).
+        """
+        old_value = self.value_by_row.pop(row_number, None)
+        if old_value is not None:
+            row_numbers = self.rows[old_value]
+            row_numbers.remove(row_number)
+            if not row_numbers:
+                del self.rows[old_value]
+        if value != "":
+            self.value_by_row[row_number] = value
+            bisect.insort(self.rows.setdefault(value, []), row_number)
+        self.last_row = max(self.last_row, row_number)
+
+    def delete_rows(self, deleted_rows):
+        """
+        Drop deleted rows and shift the rows below them up.
+        """
+        deleted_rows = sorted(set(deleted_rows))
+        kept = sorted(self.value_by_row.items())
+        self.rows = {}
+        self.value_by_row = {}
+        deleted_set = set(deleted_rows)
+        self.last_row -= bisect.bisect_right(deleted_rows, self.last_row)
+        for row_number, value in kept:
+            if row_number in deleted_set:
+                continue
+            shifted = row_number - bisect.bisect_left(deleted_rows, row_number)
+            self.value_by_row[shifted] = value
+            self.rows.setdefault(value, []).append(shifted)
+
+
+def _build(spreadsheet_id, sheet_name, key_column, api_key):
+    header, key_col_idx, key_cells = sheets_values.fetch_key_column(spreadsheet_id, sheet_name, api_key, key_column)
+    return KeyIndex(header, key_col_idx, key_cells)
+
+
+def _get_index(spreadsheet_id, sheet_name, key_column, api_key):
+    """
+    Return (index, built) where built tells whether the index was just read from the sheet.
+    """
+    key = (spreadsheet_id, sheet_name, key_column)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None and index.expires_at > time.monotonic():
+            _indexes.move_to_end(key)
+            _stats["hits"] += 1
+            return index, False
+    index = _build(spreadsheet_id, sheet_name, key_column, api_key)
+    if index.key_col_idx is None:
+        # Not cached, so a key column added later is picked up on the next call
+        return index, True
+    with _lock:
+        _stats["builds"] += 1
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > KEY_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index, True
+
+
+def get_index(spreadsheet_id, sheet_name, key_column, api_key):
+    """
+    Return the KeyIndex for a key column, building it on first use or after expiry.
+    index.key_col_idx is None when the key column is not in the header.
+    Raises requests.RequestException when the build reads fail.
+    """
+    return _get_index(spreadsheet_id, sheet_name, key_column, api_key)[0]
+
+
+def _tab_indexes(spreadsheet_id, sheet_name):
+    return [
+        index for (index_spreadsheet, index_sheet, _), index in _indexes.items()
+        if index_spreadsheet == spreadsheet_id and index_sheet == sheet_name
+    ]
+
+
+def invalidate(spreadsheet_id, sheet_name=None):
+    """
+    Drop the indexes of one tab, or of every tab when sheet_name is None.
+    """
+    with _lock:
+        for key in list(_indexes):
+            if key[0] == spreadsheet_id and (sheet_name is None or key[1] == sheet_name):
+                del _indexes[key]
+                _stats["invalidations"] += 1
+
+
+def check_index(spreadsheet_id, sheet_name, index, row_numbers, key_value, api_key):
+    """
+    Check with one small values:batchGet that the header is unchanged and that
+    every row in row_numbers still holds key_value, and add the key cells
+    written below index.last_row since the index was read. Invalidates the
+    tab's indexes and returns False when the index turns out to be stale.
+    """
+    quoted_name = sheets_ranges.quote_sheet_name(sheet_name)
+    letter = sheets_ranges.column_letter(index.key_col_idx)
+    spans = sheets_ranges.coalesce_runs(row_numbers)
+    tail_first = index.last_row + 1
+    ranges = (
+        [f"{quoted_name}!1:1", f"{quoted_name}!{letter}{tail_first}:{letter}"]
+        + [f"{quoted_name}!{letter}{first}:{letter}{last}" for first, last in spans]
+    )
+    results = sheets_values.batch_get_values(spreadsheet_id, ranges, api_key)
+    header_rows, tail_values, span_values = results[0], results[1], results[2:]
+    fresh = (header_rows[0] if header_rows else []) == index.header
+    for (first, last), values in zip(spans, span_values):
+        for offset in range(last - first + 1):
+            cell = values[offset][0] if offset < len(values) and values[offset] else ""
+            if cell != key_value:
+                fresh = False
+    if not fresh:
+        _stats["stale_detected"] += 1
+        invalidate(spreadsheet_id, sheet_name)
+        return False
+    with _lock:
+        for offset, values in enumerate(tail_values):
+            index.set(tail_first + offset, values[0] if values else "")
+    return True
+
+
+def find_rows(spreadsheet_id, sheet_name, key_column, key_value, api_key):
+    """
+    Return (header, row_numbers) for rows whose key column equals key_value.
+
+    A cached index is checked first (check_index(): one call reading the
+    header, the matched key cells and the key column below the index), and
+    rebuilt once if it is stale. row_numbers is None when the key column is
+    not in the header.
+    """
+    while True:
+        index, built = _get_index(spreadsheet_id, sheet_name, key_column, api_key)
+        if index.key_col_idx is None:
+            return index.header, None
+        if built:
+            return index.header, index.lookup(key_value)
+        if check_index(spreadsheet_id, sheet_name, index, index.lookup(key_value), key_value, api_key):
+            # The tail read may have added rows for key_value
+            return index.header, index.lookup(key_value)
+
+
+def distinct_values(spreadsheet_id, sheet_name, key_column, api_key, search="", limit=None, offset=0):
+    """
+    Return (values, total): one page of at most limit (DISTINCT_PAGE_SIZE) of
+    the distinct non-blank values of the key column in order of first
+    appearance, optionally narrowed to values starting with search
+    (case-insensitive). total counts every match, not just the page.
+    """
+    index = get_index(spreadsheet_id, sheet_name, key_column, api_key)
+    limit = DISTINCT_PAGE_SIZE if not limit else limit
+    with _lock:
+        values = list(index.rows)
+    if search:
+        search = search.lower()
+        values = [value for value in values if value.lower().startswith(search)]
+    return values[offset:offset + limit], len(values)
+
+
+def record_append(spreadsheet_id, sheet_name, updated_range, rows):
+    """
+    Apply rows appended by values:append. updated_range is the API's
+    updates.updatedRange (e.g. "Sheet1!A10:D12"); it gives the first row and column.
+    """
+    match = re.search(r"!([A-Z]+)(\d+)", updated_range or "")
+    with _lock:
+        indexes = _tab_indexes(spreadsheet_id, sheet_name)
+        if not indexes:
+            return
+        if not match:
+            invalidate(spreadsheet_id, sheet_name)
+            return
+        first_col = 0
+        for letter in match.group(1):
+            first_col = first_col * 26 + ord(letter) - ord("A") + 1
+        first_col -= 1
+        first_row = int(match.group(2))
+        for index in indexes:
+            offset = index.key_col_idx - first_col if index.key_col_idx is not None else -1
+            for row_offset, row in enumerate(rows):
+                if 0 <= offset < len(row):
+                    index.set(first_row + row_offset, str(row[offset]))
+
+
+def record_update(spreadsheet_id, sheet_name, row_numbers, new_values):
+    """
+    Apply an update that wrote new_values ({col_idx: value}) into row_numbers.
+    """
+    with _lock:
+        for index in _tab_indexes(spreadsheet_id, sheet_name):
+            if index.key_col_idx not in new_values:
+                continue
+            new_value = str(new_values[index.key_col_idx])
+            for row_number in row_numbers:
+                index.set(row_number, new_value)
+
+
+def record_delete(spreadsheet_id, sheet_name, row_numbers):
+    """
+    Apply a delete of row_numbers (rows below them move up).
+    """
+    with _lock:
+        for index in _tab_indexes(spreadsheet_id, sheet_name):
+            index.delete_rows(row_numbers)
+
+
+def index_stats():
+    """
+    Report hit/build/invalidation counters and the number of live indexes.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["size"] = len(_indexes)
+    return stats
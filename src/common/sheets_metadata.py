@@ -0,0 +1,257 @@
+"""
+Shared spreadsheet metadata cache (tab titles, sheetIds and grid sizes).
+
+Metadata is fetched once per spreadsheet with a fields mask and served from
+memory until it expires or is invalidated by a write that changes the tabs.
+
+get_data_extent() adds the used size of one tab (rows and columns holding
+data), which is what the reader's row/range dropdowns need; it is cached
+alongside the tab properties with the same TTL. The last used row comes from
+find_last_row(), which reads a few small windows backwards from the tab's
+rowCount instead of downloading the tab.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+from src.common import app_log, sheets_http, sheets_ranges
+
+log = app_log.get_logger(__name__)
+
+# === ENVIRONMENT VARIABLES ===
+METADATA_TTL = float(os.environ.get("SHEETS_METADATA_TTL", "60"))
+METADATA_CACHE_SIZE = int(os.environ.get("SHEETS_METADATA_CACHE_SIZE", "256"))
+# Rows in the first window find_last_row() reads; later windows double, up to 8x this
+EXTENT_PROBE_ROWS = int(os.environ.get("SHEETS_EXTENT_PROBE_ROWS", "200"))
+EXTENT_MAX_PROBES = int(os.environ.get("SHEETS_EXTENT_MAX_PROBES", "6"))
+# === END ENVIRONMENT VARIABLES ===
+
+METADATA_FIELDS = "sheets.properties(sheetId,title,index,gridProperties(rowCount,columnCount))"
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+_extents = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _fetch_sheet_properties(spreadsheet_id, api_key):
+    """
+    Fetch the properties of every tab, or None if the call fails.
+    Raises sheets_http.ThrottledError when rate limited.
+    """
+    url = (
+        f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}"
+        f"?key={api_key}&fields={quote(METADATA_FIELDS)}"
+    )
+    try:
+        response = sheets_http.get(url, timeout=10)
+    except sheets_http.ThrottledError:
+        raise
+    except Exception as e:
+        log.warning("Metadata request failed for %s: %s", spreadsheet_id, e)
+        return None
+    if response.status_code != 200:
+        log.warning("Metadata request returned %s: %s", response.status_code, response.text)
+        return None
+    sheets = response.json().get("sheets", [])
+    return [sheet.get("properties", {}) for sheet in sheets]
+
+
+def get_sheet_properties(spreadsheet_id, api_key):
+    """
+    Return the cached list of tab properties for a spreadsheet.
+    Returns [] when the metadata cannot be fetched; failures are not cached.
+    Rate limiting raises sheets_http.ThrottledError instead of looking like an empty spreadsheet.
+    """
+    if not spreadsheet_id or not api_key:
+        return []
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(spreadsheet_id)
+        if entry is not None and entry[0] > now:
+            _cache.move_to_end(spreadsheet_id)
+            _stats["hits"] += 1
+            return entry[1]
+        _stats["misses"] += 1
+    properties = _fetch_sheet_properties(spreadsheet_id, api_key)
+    if properties is None:
+        return []
+    with _lock:
+        _cache[spreadsheet_id] = (time.monotonic() + METADATA_TTL, properties)
+        _cache.move_to_end(spreadsheet_id)
+        while len(_cache) > METADATA_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return properties
+
+
+def get_sheets(spreadsheet_id, api_key):
+    """
+    Return [{"name": title, "gid": sheetId}, ...] for every tab in the spreadsheet.
+    """
+    return [
+        {"name": props.get("title", "Unknown"), "gid": props.get("sheetId", 0)}
+        for props in get_sheet_properties(spreadsheet_id, api_key)
+    ]
+
+
+def get_sheet_gid(spreadsheet_id, sheet_name, api_key):
+    """
+    Resolve a tab title to its numeric sheetId, or None if the tab is unknown.
+    """
+    for props in get_sheet_properties(spreadsheet_id, api_key):
+        if props.get("title") == sheet_name:
+            return props.get("sheetId", 0)
+    return None
+
+
+def _tab_grid(spreadsheet_id, sheet_name, api_key):
+    """
+    Return the cached gridProperties of a tab, or None if the tab is unknown.
+    """
+    for props in get_sheet_properties(spreadsheet_id, api_key):
+        if props.get("title") == sheet_name:
+            return props.get("gridProperties", {})
+    return None
+
+
+def _read_values(spreadsheet_id, sheet_name, api_key, a1_range):
+    """
+    Read one range of a tab with a values-only fields mask, or None if the call fails.
+    """
+    quoted_name = sheets_ranges.quote_sheet_name(sheet_name)
+    url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{quote(f'{quoted_name}!{a1_range}')}"
+    params = [("fields", "values"), ("key", api_key)]
+    try:
+        response = sheets_http.get(url, params=params, timeout=10)
+    except sheets_http.ThrottledError:
+        raise
+    except Exception as e:
+        log.warning("Values request failed for %s: %s", spreadsheet_id, e)
+        return None
+    if response.status_code != 200:
+        log.warning("Values request returned %s: %s", response.status_code, response.text)
+        return None
+    return response.json().get("values", [])
+
+
+def _probe_last_row(spreadsheet_id, sheet_name, api_key, row_count, stop_at):
+    """
+    Walk backwards from row_count in windows of EXTENT_PROBE_ROWS rows (doubling,
+    at most 8x) and return the last row holding data, stop_at - 1 when no row
+    from stop_at on does, or None if a read fails. After EXTENT_MAX_PROBES blank
+    windows the first unprobed row is returned as an upper bound.
+    """
+    end = row_count
+    window = max(EXTENT_PROBE_ROWS, 1)
+    for _ in range(EXTENT_MAX_PROBES):
+        if end < stop_at:
+            return stop_at - 1
+        start = max(end - window + 1, stop_at, 1)
+        values = _read_values(spreadsheet_id, sheet_name, api_key, f"{start}:{end}")
+        if values is None:
+            return None
+        if values:
+            # The API drops trailing blank rows, so the window's last value row is the last used row
+            return start + len(values) - 1
+        end = start - 1
+        window = min(window * 2, max(EXTENT_PROBE_ROWS, 1) * 8)
+    return max(end, stop_at - 1)
+
+
+def find_last_row(spreadsheet_id, sheet_name, api_key, stop_at=1):
+    """
+    Return the last row of a tab holding data in any column (0 for an empty
+    tab), or None if the tab is unknown or a read fails. Probing stops at row
+    stop_at: when no row from there on holds data, stop_at - 1 is returned.
+
+    Only a few small windows near the end of the grid are read. When data
+    reaches the last row of the cached grid, the tab may have grown since (an
+    INSERT_ROWS append by another worker), so the grid size is re-fetched and
+    the probe repeated past it.
+    """
+    grid = _tab_grid(spreadsheet_id, sheet_name, api_key)
+    if grid is None:
+        return None
+    while True:
+        row_count = grid.get("rowCount", 0)
+        last_row = _probe_last_row(spreadsheet_id, sheet_name, api_key, row_count, stop_at)
+        if last_row is None or last_row < row_count:
+            return last_row
+        invalidate(spreadsheet_id)
+        grid = _tab_grid(spreadsheet_id, sheet_name, api_key)
+        if grid is None or grid.get("rowCount", 0) <= row_count:
+            return last_row
+
+
+def _fetch_data_extent(spreadsheet_id, sheet_name, api_key, grid):
+    """
+    Measure the used rows (find_last_row) and the header width of a tab with a
+    few small reads. None if a call fails.
+    """
+    rows = find_last_row(spreadsheet_id, sheet_name, api_key)
+    # find_last_row re-fetches the grid when the data reaches its end
+    grid = _tab_grid(spreadsheet_id, sheet_name, api_key) or grid
+    header_rows = _read_values(spreadsheet_id, sheet_name, api_key, "1:1") if rows else []
+    if rows is None or header_rows is None:
+        return None
+    columns = len(header_rows[0]) if header_rows else 0
+    return {
+        "rows": min(rows, grid.get("rowCount", rows)),
+        "columns": min(columns, grid.get("columnCount", columns)),
+        "grid_rows": grid.get("rowCount", 0),
+        "grid_columns": grid.get("columnCount", 0),
+    }
+
+
+def get_data_extent(spreadsheet_id, sheet_name, api_key):
+    """
+    Return {"rows", "columns", "grid_rows", "grid_columns"} for a tab, or None
+    if the tab is unknown or the data cannot be read.
+
+    rows is the last row with data in any column and columns the width of
+    the header row, both bounded by the tab's gridProperties.
+    """
+    grid = _tab_grid(spreadsheet_id, sheet_name, api_key)
+    if grid is None:
+        return None
+    key = (spreadsheet_id, sheet_name)
+    with _lock:
+        entry = _extents.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            _extents.move_to_end(key)
+            _stats["hits"] += 1
+            return entry[1]
+        _stats["misses"] += 1
+    extent = _fetch_data_extent(spreadsheet_id, sheet_name, api_key, grid)
+    if extent is None:
+        return None
+    with _lock:
+        _extents[key] = (time.monotonic() + METADATA_TTL, extent)
+        _extents.move_to_end(key)
+        while len(_extents) > METADATA_CACHE_SIZE:
+            _extents.popitem(last=False)
+    return extent
+
+
+def invalidate(spreadsheet_id):
+    """
+    Drop the cached metadata for a spreadsheet after a write that changes its tabs.
+    """
+    with _lock:
+        if _cache.pop(spreadsheet_id, None) is not None:
+            _stats["invalidations"] += 1
+        for key in [key for key in _extents if key[0] == spreadsheet_id]:
+            del _extents[key]
+
+
+def cache_stats():
+    """
+    Report hit/miss counters and current size of the metadata cache.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["size"] = len(_cache)
+        stats["extents"] = len(_extents)
+    return stats
@@ -0,0 +1,176 @@
+"""
+Client-side token buckets that keep this process under the Sheets API quotas.
+
+The API limits read and write requests per minute per project and per user
+per project. Calls carry their own credential, so the buckets are keyed on
+it: sheets_http passes a (project, user) pair derived from the call's API key
+(one key belongs to one project, and every call from this server counts as
+the same user) or from the service account behind its bearer token
+(project_id and client_email). Each process keeps a read and a write bucket
+per project and per user, refilled continuously at the per-minute limit
+divided across the gunicorn workers. sheets_http takes a token from both
+before each call (reserve() for callers that wait on their own, such as the
+asyncio client), so a burst is spread out over time instead of being
+answered with 429s. When the API answers 429 anyway, throttle() pauses the
+user's bucket so concurrent callers back off together.
+
+Waiting blocks the calling thread. With the default sync workers
+(GUNICORN_THREADS=1) a request can therefore hold its worker for up to
+SHEETS_QUOTA_MAX_WAIT seconds before it is sent or reported as throttled;
+lower it when workers must stay responsive.
+
+A limit of 0 disables that bucket.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# === ENVIRONMENT VARIABLES ===
+QUOTA_READS_PER_MINUTE = float(os.environ.get("SHEETS_QUOTA_READS_PER_MINUTE", "300"))
+QUOTA_WRITES_PER_MINUTE = float(os.environ.get("SHEETS_QUOTA_WRITES_PER_MINUTE", "300"))
+QUOTA_USER_READS_PER_MINUTE = float(os.environ.get("SHEETS_QUOTA_USER_READS_PER_MINUTE", "60"))
+QUOTA_USER_WRITES_PER_MINUTE = float(os.environ.get("SHEETS_QUOTA_USER_WRITES_PER_MINUTE", "60"))
+# Seconds of quota a bucket may hand out at once after being idle
+QUOTA_BURST_SECONDS = float(os.environ.get("SHEETS_QUOTA_BURST_SECONDS", "10"))
+# Longest a call waits (blocking its thread) for a token before it is reported as throttled
+QUOTA_MAX_WAIT = float(os.environ.get("SHEETS_QUOTA_MAX_WAIT", "30"))
+# gunicorn_config.py exports GUNICORN_WORKERS; each worker takes its share of the quota
+GUNICORN_WORKERS = int(os.environ.get("GUNICORN_WORKERS", "1"))
+# === END ENVIRONMENT VARIABLES ===
+
+MAX_BUCKETS = 1024
+
+_PROJECT_LIMITS = {"read": QUOTA_READS_PER_MINUTE, "write": QUOTA_WRITES_PER_MINUTE}
+_USER_LIMITS = {"read": QUOTA_USER_READS_PER_MINUTE, "write": QUOTA_USER_WRITES_PER_MINUTE}
+
+_lock = threading.Lock()
+_project_buckets = OrderedDict()
+_user_buckets = OrderedDict()
+_stats = {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "rejected": 0, "throttled": 0}
+
+
+class _Bucket:
+    """
+    Token bucket whose balance may go negative: a negative balance is the
+    queue of callers that already hold a reservation and are waiting for it.
+    """
+
+    def __init__(self, per_minute):
+        workers = max(GUNICORN_WORKERS, 1)
+        self.rate = per_minute / 60.0 / workers
+        self.capacity = max(self.rate * QUOTA_BURST_SECONDS, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self, now):
+        """
+        Take one token and return how long the caller must wait before using it.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def refund(self):
+        self.tokens += 1
+
+
+def _bucket(buckets, key, per_minute):
+    bucket = buckets.get(key)
+    if bucket is None:
+        bucket = buckets[key] = _Bucket(per_minute)
+        while len(buckets) > MAX_BUCKETS:
+            buckets.popitem(last=False)
+    else:
+        buckets.move_to_end(key)
+    return bucket
+
+
+def _buckets(kind, credential):
+    """
+    Return the project and user buckets for credential, a (project, user)
+    pair; calls without one share the (None, None) buckets.
+    """
+    project, user = credential or (None, None)
+    buckets = []
+    if _PROJECT_LIMITS[kind] > 0:
+        buckets.append(_bucket(_project_buckets, (kind, project), _PROJECT_LIMITS[kind]))
+    if _USER_LIMITS[kind] > 0:
+        buckets.append(_bucket(_user_buckets, (kind, project, user), _USER_LIMITS[kind]))
+    return buckets
+
+
+def reserve(kind, credential=None, max_wait=None):
+    """
+    Take a token for a "read" or "write" call made with credential and return
+    the seconds the caller must wait before sending it, or None, without
+    taking anything, when that would be longer than max_wait.
+    """
+    max_wait = QUOTA_MAX_WAIT if max_wait is None else max_wait
+    with _lock:
+        now = time.monotonic()
+        buckets = _buckets(kind, credential)
+        wait = max([bucket.reserve(now) for bucket in buckets], default=0.0)
+        if wait > max_wait:
+            for bucket in buckets:
+                bucket.refund()
+            _stats["rejected"] += 1
+            return None
+        _stats["acquired"] += 1
+        if wait > 0:
+            _stats["waited"] += 1
+            _stats["wait_seconds"] += wait
+    return wait
+
+
+def acquire(kind, credential=None, max_wait=None):
+    """
+    Block until a "read" or "write" call made with credential fits the quota.
+    Returns False, without waiting, when that would take longer than max_wait.
+    """
+    wait = reserve(kind, credential, max_wait)
+    if wait is None:
+        return False
+    if wait > 0:
+        time.sleep(wait)
+    return True
+
+
+def throttle(kind, credential, delay):
+    """
+    Record a 429 for credential: its user bucket hands out no tokens for delay
+    seconds and its project bucket loses its saved-up burst.
+    """
+    project, user = credential or (None, None)
+    with _lock:
+        now = time.monotonic()
+        for bucket in _buckets(kind, credential):
+            bucket.tokens = min(bucket.tokens, 0.0)
+            bucket.updated = now
+        bucket = _user_buckets.get((kind, project, user))
+        if bucket is not None:
+            bucket.paused_until = max(bucket.paused_until, now + delay)
+        _stats["throttled"] += 1
+
+
+def reset():
+    """
+    Drop every bucket; the next call starts with a full burst.
+    """
+    with _lock:
+        _project_buckets.clear()
+        _user_buckets.clear()
+
+
+def quota_stats():
+    """
+    Report how many calls waited for or were refused a token, and how many 429s were seen.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["project_buckets"] = len(_project_buckets)
+        stats["user_buckets"] = len(_user_buckets)
+    return stats
@@ -0,0 +1,80 @@
+"""
+Helpers for building compact row spans and A1 ranges for Sheets requests.
+"""
+
+
+def coalesce_runs(numbers):
+    """
+    Merge row numbers (or column indexes) into sorted, inclusive (first, last) spans.
+    e.g. [2, 3, 4, 7, 9, 10] -> [(2, 4), (7, 7), (9, 10)]
+    """
+    spans = []
+    for number in sorted(set(numbers)):
+        if spans and number == spans[-1][1] + 1:
+            spans[-1] = (spans[-1][0], number)
+        else:
+            spans.append((number, number))
+    return spans
+
+
+def column_letter(col_idx):
+    """
+    Convert a 0-based column index to its A1 letters at any width.
+    e.g. 0 -> "A", 25 -> "Z", 26 -> "AA", 701 -> "ZZ", 702 -> "AAA"
+    """
+    if col_idx < 0:
+        raise ValueError(f"Column index must be >= 0, got {col_idx}")
+    letters = ""
+    col_num = col_idx + 1
+    while col_num:
+        col_num, remainder = divmod(col_num - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def quote_sheet_name(sheet_name):
+    """
+    Quote a tab title for use in an A1 range, escaping embedded single quotes.
+    """
+    return "'" + sheet_name.replace("'", "''") + "'"
+
+
+def a1_range(sheet_name, first_row, first_col, last_row=None, last_col=None):
+    """
+    Build an A1 range from 1-based rows and 0-based column indexes.
+    A single cell is returned when last_row/last_col are omitted.
+    """
+    start = f"{column_letter(first_col)}{first_row}"
+    if last_row is None and last_col is None:
+        return f"{quote_sheet_name(sheet_name)}!{start}"
+    last_row = first_row if last_row is None else last_row
+    last_col = first_col if last_col is None else last_col
+    return f"{quote_sheet_name(sheet_name)}!{start}:{column_letter(last_col)}{last_row}"
+
+
+def chunked(items, size):
+    """
+    Yield successive lists of at most size items.
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def chunked_by_size(items, max_bytes, max_items, size_of):
+    """
+    Yield successive lists whose summed size_of(item) stays within max_bytes
+    and whose length stays within max_items. An item larger than max_bytes
+    is yielded on its own.
+    """
+    chunk = []
+    chunk_bytes = 0
+    for item in items:
+        item_bytes = size_of(item)
+        if chunk and (chunk_bytes + item_bytes > max_bytes or len(chunk) >= max_items):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(item)
+        chunk_bytes += item_bytes
+    if chunk:
+        yield chunk
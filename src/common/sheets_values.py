@@ -0,0 +1,183 @@
+"""
+Reads of cell values through the Sheets API v4 values endpoints: chunked row
+reads, column-only reads and reads of selected row spans.
+
+When the asyncio client is enabled (see sheets_async), reads that need
+several calls send them concurrently instead of one after another.
+"""
+import os
+from urllib.parse import quote
+
+from src.common import sheets_async, sheets_http, sheets_metadata, sheets_ranges
+
+# === ENVIRONMENT VARIABLES ===
+READ_CHUNK_ROWS = int(os.environ.get("SHEETS_READ_CHUNK_ROWS", "2000"))
+# Ranges per values:batchGet call, which keeps the request URL a reasonable length
+BATCH_GET_MAX_RANGES = int(os.environ.get("SHEETS_BATCH_GET_MAX_RANGES", "100"))
+# === END ENVIRONMENT VARIABLES ===
+
+
+def _values_url(spreadsheet_id, range_string, api_key):
+    return (
+        f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}"
+        f"/values/{quote(range_string)}?key={api_key}"
+    )
+
+
+def get_values(spreadsheet_id, range_string, api_key, timeout=30):
+    """
+    Fetch one A1 range and return its values (rows of strings).
+    Raises requests.RequestException when the call fails.
+    """
+    response = sheets_http.get(_values_url(spreadsheet_id, range_string, api_key), timeout=timeout)
+    response.raise_for_status()
+    return response.json().get("values", [])
+
+
+async def get_values_async(spreadsheet_id, range_string, api_key, timeout=30):
+    """
+    get_values on the asyncio client.
+    """
+    response = await sheets_async.get(_values_url(spreadsheet_id, range_string, api_key), timeout=timeout)
+    response.raise_for_status()
+    return response.json().get("values", [])
+
+
+def get_values_many(spreadsheet_id, range_strings, api_key, timeout=30):
+    """
+    Fetch several A1 ranges with one values.get each and return their values
+    in order; the calls overlap when the asyncio client is enabled.
+    """
+    if len(range_strings) > 1 and sheets_async.enabled():
+        return sheets_async.run(sheets_async.gather([
+            get_values_async(spreadsheet_id, range_string, api_key, timeout) for range_string in range_strings
+        ]))
+    return [get_values(spreadsheet_id, range_string, api_key, timeout) for range_string in range_strings]
+
+
+def get_header(spreadsheet_id, sheet_name, api_key):
+    """
+    Read only the header row of a tab ([] when the tab is empty).
+    """
+    header_rows = get_values(spreadsheet_id, f"{sheets_ranges.quote_sheet_name(sheet_name)}!1:1", api_key)
+    return header_rows[0] if header_rows else []
+
+
+def fetch_key_column(spreadsheet_id, sheet_name, api_key, key_column):
+    """
+    Read the header row and then only the named column below it.
+    Returns (header, key_col_idx, cells) where cell i belongs to sheet row i + 2;
+    key_col_idx is None and cells [] when the column is not in the header.
+    """
+    header = get_header(spreadsheet_id, sheet_name, api_key)
+    if key_column not in header:
+        return header, None, []
+    key_col_idx = header.index(key_column)
+    cells = fetch_columns(spreadsheet_id, sheet_name, api_key, [key_col_idx])[key_col_idx]
+    return header, key_col_idx, cells
+
+
+def fetch_rows(spreadsheet_id, sheet_name, api_key, first_row=1, last_row=None, chunk_rows=None):
+    """
+    Read whole rows first_row..last_row (1-based, inclusive) in fixed-size chunks.
+
+    When last_row is None the read continues to the tab's last used row, found
+    with a few small probes from the end of the grid (sheets_metadata.find_last_row),
+    so neither a run of blank rows nor a grid that grew since the metadata was
+    cached cuts the data short, and no blank chunks below the data are read.
+    Empty chunks only end the read when the probe fails. Row i of the result
+    is sheet row first_row + i; blank rows inside the data are returned as []
+    and trailing blank rows are dropped.
+
+    With the asyncio client, up to ASYNC_READ_AHEAD chunks are read at a time
+    once a chunk has come back full (data may continue past it); until then,
+    and after a chunk that was not full, chunks are read one by one.
+    """
+    chunk_rows = chunk_rows or READ_CHUNK_ROWS
+    if last_row is None:
+        last_row = sheets_metadata.find_last_row(spreadsheet_id, sheet_name, api_key, first_row)
+    quoted_name = sheets_ranges.quote_sheet_name(sheet_name)
+    read_ahead = max(sheets_async.ASYNC_READ_AHEAD, 1) if sheets_async.enabled() else 1
+    rows = []
+    start = first_row
+    exhausted = False
+    last_chunk_full = False
+    while not exhausted and (last_row is None or start <= last_row):
+        spans = []
+        wave = read_ahead if last_chunk_full else 1
+        while len(spans) < wave and (last_row is None or start <= last_row):
+            end = start + chunk_rows - 1
+            if last_row is not None:
+                end = min(end, last_row)
+            spans.append((start, end))
+            start = end + 1
+        chunks = get_values_many(spreadsheet_id, [f"{quoted_name}!{first}:{last}" for first, last in spans], api_key)
+        for (first, last), chunk in zip(spans, chunks):
+            if not chunk and last_row is None:
+                exhausted = True
+                break
+            # Keep row positions aligned when the API omits trailing blank rows of a chunk
+            rows.extend(chunk)
+            rows.extend([] for _ in range(last - first + 1 - len(chunk)))
+            last_chunk_full = len(chunk) == last - first + 1
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+def batch_get_values(spreadsheet_id, ranges, api_key, major_dimension="ROWS", timeout=30):
+    """
+    Fetch several A1 ranges with values:batchGet and return their values in request order.
+    Ranges are split across calls of at most BATCH_GET_MAX_RANGES ranges each,
+    sent concurrently when the asyncio client is enabled.
+    Raises requests.RequestException when a call fails.
+    """
+    results = []
+    url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values:batchGet"
+    param_sets = []
+    for range_chunk in sheets_ranges.chunked(list(ranges), BATCH_GET_MAX_RANGES):
+        params = [("ranges", range_string) for range_string in range_chunk]
+        params += [("majorDimension", major_dimension), ("key", api_key)]
+        param_sets.append(params)
+    if len(param_sets) > 1 and sheets_async.enabled():
+        responses = sheets_async.run(sheets_async.gather([
+            sheets_async.get(url, params=params, timeout=timeout) for params in param_sets
+        ]))
+    else:
+        responses = (sheets_http.get(url, params=params, timeout=timeout) for params in param_sets)
+    for response in responses:
+        response.raise_for_status()
+        value_ranges = response.json().get("valueRanges", [])
+        results.extend(value_range.get("values", []) for value_range in value_ranges)
+    return results
+
+
+def fetch_columns(spreadsheet_id, sheet_name, api_key, col_indexes, first_row=2):
+    """
+    Read whole columns (from first_row down) for the given 0-based column indexes.
+    Returns {col_idx: [cell, ...]} where cell i belongs to sheet row first_row + i;
+    trailing blank cells are dropped by the API, so columns may differ in length.
+    """
+    col_indexes = sorted(set(col_indexes))
+    quoted_name = sheets_ranges.quote_sheet_name(sheet_name)
+    ranges = []
+    for col_idx in col_indexes:
+        letter = sheets_ranges.column_letter(col_idx)
+        ranges.append(f"{quoted_name}!{letter}{first_row}:{letter}")
+    columns = batch_get_values(spreadsheet_id, ranges, api_key, major_dimension="COLUMNS")
+    return {col_idx: (values[0] if values else []) for col_idx, values in zip(col_indexes, columns)}
+
+
+def fetch_row_spans(spreadsheet_id, sheet_name, api_key, row_numbers):
+    """
+    Read only the given whole rows, merging them into contiguous ranges.
+    Returns {row_number: row}; blank rows come back as [].
+    """
+    quoted_name = sheets_ranges.quote_sheet_name(sheet_name)
+    spans = sheets_ranges.coalesce_runs(row_numbers)
+    ranges = [f"{quoted_name}!{first_row}:{last_row}" for first_row, last_row in spans]
+    rows = {}
+    for (first_row, last_row), values in zip(spans, batch_get_values(spreadsheet_id, ranges, api_key)):
+        for offset in range(last_row - first_row + 1):
+            rows[first_row + offset] = values[offset] if offset < len(values) else []
+    return rows
@@ -1,15 +1,21 @@
 from flask import request as flask_request
 from workflows_cdk import Response, Request
 from main import router
-import requests
+import traceback
+from src.common import app_log, content_fanout, sheets_append_batcher, sheets_auth, sheets_http, sheets_key_index, sheets_metadata, sheets_ranges
 from urllib.parse import quote
 import os
 import json
 
+log = app_log.get_logger(__name__)
+
 # === ENVIRONMENT VARIABLES ===
 API_KEY = os.environ.get("GOOGLE_SHEETS_API_KEY")
 SERVICE_ACCOUNT_JSON_STR = os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON")
 SERVICE_ACCOUNT_JSON = json.loads(SERVICE_ACCOUNT_JSON_STR) if SERVICE_ACCOUNT_JSON_STR else None
+# Bounds for one values:append call in bulk mode (request body bytes and rows)
+APPEND_MAX_CHUNK_BYTES = int(os.environ.get("SHEETS_APPEND_MAX_CHUNK_BYTES", "2000000"))
+APPEND_MAX_CHUNK_ROWS = int(os.environ.get("SHEETS_APPEND_MAX_CHUNK_ROWS", "10000"))
 # === END ENVIRONMENT VARIABLES ===
 
 def get_google_credentials(service_account_json=None):
@@ -18,7 +24,7 @@ def get_google_credentials(service_account_json=None):
     """
     try:
         if service_account_json:
-            print("DEBUG: Using service account credentials from JSON")
+            log.debug("Using service account credentials from JSON")
             
             # Parse the JSON string if it's a string
             if isinstance(service_account_json, str):
@@ -36,11 +42,11 @@ def get_google_credentials(service_account_json=None):
             )
             return credentials
         else:
-            print("DEBUG: No service account JSON provided")
+            log.debug("No service account JSON provided")
             return None
             
     except Exception as e:
-        print(f"DEBUG: Error getting service account credentials: {str(e)}")
+        log.warning("Error getting service account credentials: %s", e)
         return None
 
 def get_google_service(service_account_json=None):
@@ -48,40 +54,33 @@ def get_google_service(service_account_json=None):
     Get Google Sheets service using service account credentials.
     """
     if not GOOGLE_LIBS_AVAILABLE:
-        print("DEBUG: Google API libraries not available")
+        log.debug("Google API libraries not available")
         return None
         
     credentials = get_google_credentials(service_account_json)
     if credentials:
         try:
             service = googleapiclient.discovery.build('sheets', 'v4', credentials=credentials)
-            print("DEBUG: Successfully created Google Sheets service with service account")
+            log.debug("Successfully created Google Sheets service with service account")
             return service
         except Exception as e:
-            print(f"DEBUG: Error creating Google service: {str(e)}")
+            log.warning("Error creating Google service: %s", e)
             return None
     return None
 
-def add_row_with_service_account(spreadsheet_id, sheet_name, row_values, target_row, service_account_json):
+def append_rows_with_service_account(spreadsheet_id, sheet_name, rows, service_account_json):
     """
-    Add row using Google Sheets API v4 with service account authentication (direct HTTP).
-    Always appends to the end of the sheet, ignoring target_row.
+    Append rows to the end of the sheet with values:append, splitting them into
+    chunks bounded by APPEND_MAX_CHUNK_BYTES and APPEND_MAX_CHUNK_ROWS.
+    Returns (success, message, chunk_results); on failure chunk_results holds
+    the chunks that were appended before the failing one.
     """
+    chunk_results = []
     try:
-        # 1. Get access token from service account JSON
-        from google.oauth2 import service_account
-        from google.auth.transport.requests import Request
-
-        # Parse JSON if needed
-        if isinstance(service_account_json, str):
-            account_info = json.loads(service_account_json)
-        else:
-            account_info = service_account_json
-
-        scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-        creds = service_account.Credentials.from_service_account_info(account_info, scopes=scopes)
-        creds.refresh(Request())
-        token = creds.token
+        # 1. Get a cached access token for the service account
+        token = sheets_auth.get_access_token(sheets_auth.SPREADSHEETS_SCOPES, service_account_json)
+        if not token:
+            return False, "Service account credentials are not available", chunk_results
 
         # 2. Prepare the API call
         # Always append to the end: use only the sheet name as the range
@@ -98,80 +97,77 @@ def add_row_with_service_account(spreadsheet_id, sheet_name, row_values, target_
             "Content-Type": "application/json",
         }
 
-        body = {
-            "values": [row_values]
-        }
+        # 3. Make one request per chunk, in order
+        chunks = sheets_ranges.chunked_by_size(
+            rows, APPEND_MAX_CHUNK_BYTES, APPEND_MAX_CHUNK_ROWS,
+            lambda row: len(json.dumps(row)) + 1
+        )
+        for chunk in chunks:
+            resp = sheets_http.post(url, headers=headers, json={"values": chunk})
+            if resp.status_code not in [200, 201]:
+                rows_added = sum(result["rows"] for result in chunk_results)
+                return False, f"Failed to add rows after adding {rows_added} row(s): {resp.status_code} {resp.text}", chunk_results
 
-        # 3. Make the request
-        resp = requests.post(url, headers=headers, json=body)
-        if resp.status_code not in [200, 201]:
-            return False, f"Failed to add row: {resp.status_code} {resp.text}"
+            updates = resp.json().get("updates", {})
+            updated_range = updates.get("updatedRange", range_part)
+            chunk_results.append({
+                "updated_range": updated_range,
+                "rows": len(chunk),
+                "updated_cells": updates.get("updatedCells", 0)
+            })
+            sheets_key_index.record_append(spreadsheet_id, sheet_name, updated_range, chunk)
+            # INSERT_ROWS grew the grid, so the cached rowCount is out of date
+            sheets_metadata.invalidate(spreadsheet_id)
 
-        result = resp.json()
-        updated_range = result.get("updates", {}).get("updatedRange", range_part)
-        updated_cells = result.get("updates", {}).get("updatedCells", 0)
-
-        return True, f"Successfully added row at {updated_range} ({updated_cells} cells updated)"
+        rows_added = sum(result["rows"] for result in chunk_results)
+        return True, f"Successfully added {rows_added} row(s) in {len(chunk_results)} request(s)", chunk_results
 
     except Exception as e:
-        error_msg = f"Failed to add row using service account: {str(e)}"
-        print(f"DEBUG: {error_msg}")
-        print(f"DEBUG: Service account add row traceback: {traceback.format_exc()}")
-        return False, error_msg
+        error_msg = f"Failed to add rows using service account: {str(e)}"
+        log.warning("%s", error_msg)
+        log.debug("Service account add rows traceback: %s", traceback.format_exc())
+        return False, error_msg, chunk_results
 
-def get_sheets_with_api_v4(spreadsheet_id):
+def append_rows(spreadsheet_id, sheet_name, rows, service_account_json):
     """
-    Use Google Sheets API v4 to get sheet information.
+    Append rows, joining a group-commit batch for the tab when SHEETS_APPEND_BATCH_WINDOW_MS is set
+    and the worker is threaded.
+    Returns (success, message, chunk_results) for these rows only.
     """
-    try:
-        print(f"DEBUG: get_sheets_with_api_v4 called with spreadsheet_id={spreadsheet_id}, api_key={'[PROVIDED]' if API_KEY else '[MISSING]'}")
-        
-        if not API_KEY:
-            print("DEBUG: API key is missing")
-            return []
-        
-        # Official API v4 endpoint for getting spreadsheet metadata
-        metadata_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}?key={API_KEY}"
-        
-        print(f"DEBUG: Fetching metadata from: {metadata_url}")
-        
-        response = requests.get(metadata_url, timeout=10)
-        print(f"DEBUG: API response status code: {response.status_code}")
-        
-        if response.status_code != 200:
-            print(f"DEBUG: API returned non-200 status: {response.status_code}")
-            print(f"DEBUG: API response text: {response.text}")
-            return []
-        
-        response.raise_for_status()
-        
-        metadata = response.json()
-        sheets = metadata.get('sheets', [])
-        print(f"DEBUG: Found {len(sheets)} sheets in metadata")
-        
-        available_sheets = []
-        for i, sheet in enumerate(sheets):
-            properties = sheet.get('properties', {})
-            sheet_name = properties.get('title', 'Unknown')
-            sheet_id = properties.get('sheetId', 0)
-            
-            available_sheets.append({
-                "name": sheet_name,
-                "gid": sheet_id
-            })
-            print(f"DEBUG: Sheet {i+1}: {sheet_name} (GID: {sheet_id})")
-        
-        print(f"DEBUG: get_sheets_with_api_v4 returning {len(available_sheets)} sheets")
-        return available_sheets
-        
-    except requests.RequestException as e:
-        print(f"DEBUG: Sheets API v4 failed with RequestException: {str(e)}")
-        print(f"DEBUG: RequestException traceback: {traceback.format_exc()}")
-        return []
-    except Exception as e:
-        print(f"DEBUG: Sheets API v4 failed with general Exception: {str(e)}")
-        print(f"DEBUG: General exception traceback: {traceback.format_exc()}")
-        return []
+    if not sheets_append_batcher.enabled():
+        return append_rows_with_service_account(spreadsheet_id, sheet_name, rows, service_account_json)
+    account = (service_account_json or {}).get("client_email")
+    return sheets_append_batcher.submit(
+        (spreadsheet_id, sheet_name, account),
+        rows,
+        lambda batch_rows: append_rows_with_service_account(spreadsheet_id, sheet_name, batch_rows, service_account_json)
+    )
+
+def add_row_with_service_account(spreadsheet_id, sheet_name, row_values, target_row, service_account_json):
+    """
+    Add row using Google Sheets API v4 with service account authentication (direct HTTP).
+    Always appends to the end of the sheet, ignoring target_row.
+    """
+    success, message, chunk_results = append_rows(
+        spreadsheet_id, sheet_name, [row_values], service_account_json
+    )
+    if not success:
+        return False, message
+    result = chunk_results[0]
+    return True, f"Successfully added row at {result['updated_range']} ({result['updated_cells']} cells updated)"
+
+def parse_row_values(row_data):
+    """
+    Extract the ordered cell values from a row_data array (column/value items or plain strings).
+    """
+    row_values = []
+    for item in row_data:
+        if isinstance(item, dict):
+            column_value = item.get("column_value", "")
+            row_values.append(str(column_value))
+        elif isinstance(item, str):
+            row_values.append(item)
+    return row_values
 
 def find_next_empty_row(spreadsheet_id, sheet_name, api_key):
     """
@@ -185,7 +181,7 @@ def find_next_empty_row(spreadsheet_id, sheet_name, api_key):
         # Official API v4 endpoint for getting values
         data_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{encoded_range}?key={api_key}"
         
-        response = requests.get(data_url, timeout=30)
+        response = sheets_http.get(data_url, timeout=30)
         response.raise_for_status()
         
         data = response.json()
@@ -193,11 +189,14 @@ def find_next_empty_row(spreadsheet_id, sheet_name, api_key):
         
         # Next empty row is after the last row with data
         next_row = len(values) + 1
-        print(f"DEBUG: Found {len(values)} rows with data, next empty row is {next_row}")
+        log.debug("Found %s rows with data, next empty row is %s", len(values), next_row)
         return next_row
         
+    except sheets_http.ThrottledError:
+        # Falling back to row 1 would overwrite the header
+        raise
     except Exception as e:
-        print(f"DEBUG: Error finding next empty row: {str(e)}")
+        log.warning("Error finding next empty row: %s", e)
         return 1  # Default to row 1 if we can't determine
 
 def add_row_to_sheet(spreadsheet_id, sheet_name, api_key, row_values, target_row=None):
@@ -231,21 +230,21 @@ def add_row_to_sheet(spreadsheet_id, sheet_name, api_key, row_values, target_row
             "valueInputOption": "USER_ENTERED"
         }
         
-        print(f"DEBUG: Adding row to {range_name}")
-        print(f"DEBUG: Update URL: {update_url}")
-        print(f"DEBUG: Payload: {payload}")
-        print(f"DEBUG: Params: {params}")
+        log.debug("Adding row to %s", range_name)
+        log.debug("Update URL: %s", update_url)
+        log.debug("Payload: %s", payload)
+        log.debug("Params: %s", params)
         
         # Use PUT method as specified in official documentation
-        response = requests.put(
+        response = sheets_http.put(
             update_url,
             json=payload,
             params=params,
             timeout=30
         )
         
-        print(f"DEBUG: API response status: {response.status_code}")
-        print(f"DEBUG: API response text: {response.text}")
+        log.debug("API response status: %s", response.status_code)
+        log.debug("API response text: %s", response.text)
         
         if response.status_code not in [200, 201]:
             error_detail = ""
@@ -255,11 +254,11 @@ def add_row_to_sheet(spreadsheet_id, sheet_name, api_key, row_values, target_row
             except:
                 error_detail = response.text
             
-            print(f"DEBUG: Add row failed with status {response.status_code}: {error_detail}")
+            log.warning("Add row failed with status %s: %s", response.status_code, error_detail)
             return False, f"Failed to add row: {error_detail}"
         
         result = response.json()
-        print(f"DEBUG: Add row successful: {result}")
+        log.debug("Add row successful: %s", result)
         
         updated_cells = result.get("updatedCells", 0)
         updated_range = result.get("updatedRange", range_name)
@@ -268,24 +267,25 @@ def add_row_to_sheet(spreadsheet_id, sheet_name, api_key, row_values, target_row
         
     except Exception as e:
         error_msg = f"Failed to add row to sheet: {str(e)}"
-        print(f"DEBUG: {error_msg}")
-        print(f"DEBUG: Add row traceback: {traceback.format_exc()}")
+        log.warning("%s", error_msg)
+        log.debug("Add row traceback: %s", traceback.format_exc())
         return False, error_msg
 
 @router.route("/content", methods=["POST"])
+@sheets_http.request_scoped_fetches
 def content():
     """
     Provide dynamic content for the module UI.
     Fetches sheet information from Google Sheets using API key and sheet ID.
     """
     try:
-        print("DEBUG: add_row_to_sheet /content called")
+        log.debug("add_row_to_sheet /content called")
 
         # Parse the request
         request = Request(flask_request)
         data = request.data
 
-        print(f"DEBUG: Parsed data = {data}")
+        log.debug("Parsed data = %s", data)
 
         # Get required parameters from form_data
         form_data = data.get("form_data", {})
@@ -299,30 +299,28 @@ def content():
 
         # Get requested content objects
         content_object_names = data.get("content_object_names", [])
-        content_objects = []
 
-        print(f"DEBUG: Content object names requested = {content_object_names}")
-        print(f"DEBUG: sheet_id = {sheet_id}")
-        print(f"DEBUG: api_key = {'[PROVIDED]' if API_KEY else '[NOT PROVIDED]'}")
-        print(f"DEBUG: service_account_json = {'[PROVIDED]' if SERVICE_ACCOUNT_JSON else '[NOT PROVIDED]'}")
+        log.debug("Content object names requested = %s", content_object_names)
+        log.debug("sheet_id = %s", sheet_id)
+        log.debug("api_key = %s", '[PROVIDED]' if API_KEY else '[NOT PROVIDED]')
+        log.debug("service_account_json = %s", '[PROVIDED]' if SERVICE_ACCOUNT_JSON else '[NOT PROVIDED]')
 
         # Process each requested content object
-        for content_name in content_object_names:
+        def resolve_content_object(content_name):
             if content_name.get("id") == "sheet_names":
-                print("DEBUG: Processing sheet_names content object")
+                log.debug("Processing sheet_names content object")
                 
                 # If no sheet_id or api_key, return empty list
                 if not sheet_id or not API_KEY:
-                    print("DEBUG: Missing sheet_id or api_key, returning empty sheet_names")
-                    content_objects.append({
+                    log.debug("Missing sheet_id or api_key, returning empty sheet_names")
+                    return {
                         "content_object_name": "sheet_names",
                         "data": []
-                    })
-                    continue
+                    }
 
                 # Get sheet information using API v4 (still use API key for reading metadata)
-                print("DEBUG: Fetching sheets using API v4")
-                available_sheets = get_sheets_with_api_v4(sheet_id)
+                log.debug("Fetching sheets using API v4")
+                available_sheets = sheets_metadata.get_sheets(sheet_id, API_KEY)
                 
                 # Format for StackSync
                 sheet_options = []
@@ -332,35 +330,36 @@ def content():
                         "label": sheet["name"]
                     })
                 
-                print(f"DEBUG: Formatted {len(sheet_options)} sheet options")
+                log.debug("Formatted %s sheet options", len(sheet_options))
                 
-                content_objects.append({
+                return {
                     "content_object_name": "sheet_names",
                     "data": sheet_options
-                })
+                }
             elif content_name.get("id") == "column_names":
-                print("DEBUG: Processing column_names content object")
+                log.debug("Processing column_names content object")
                 # If no sheet_id or sheet_name, return empty list
                 if not sheet_id or not sheet_name:
-                    print("DEBUG: Missing sheet_id or sheet_name, returning empty column_names")
-                    content_objects.append({
+                    log.debug("Missing sheet_id or sheet_name, returning empty column_names")
+                    return {
                         "content_object_name": "column_names",
                         "data": []
-                    })
-                    continue
+                    }
                 # Get column names (header) from the sheet using API key
                 header = []
                 try:
                     range_string = f"{sheet_name}!1:1"
                     encoded_range = quote(range_string)
                     url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}/values/{encoded_range}?key={API_KEY}"
-                    resp = requests.get(url, timeout=10)
+                    resp = sheets_http.get(url, timeout=10)
                     if resp.status_code == 200:
-                        data = resp.json().get("values", [])
-                        if data:
-                            header = data[0]
+                        values = resp.json().get("values", [])
+                        if values:
+                            header = values[0]
+                except sheets_http.ThrottledError:
+                    raise
                 except Exception as e:
-                    print(f"DEBUG: Failed to fetch column names: {str(e)}")
+                    log.warning("Failed to fetch column names: %s", e)
                 # Format for StackSync
                 column_options = []
                 for col in header:
@@ -368,21 +367,66 @@ def content():
                         "value": {"id": col, "label": col},
                         "label": col
                     })
-                print(f"DEBUG: Formatted {len(column_options)} column options")
-                content_objects.append({
+                log.debug("Formatted %s column options", len(column_options))
+                return {
                     "content_object_name": "column_names",
                     "data": column_options
-                })
+                }
+
+        content_objects = content_fanout.resolve_in_order(content_object_names, resolve_content_object)
 
-        print(f"DEBUG: Returning {len(content_objects)} content objects")
+        log.debug("Returning %s content objects", len(content_objects))
 
         return Response(data={"content_objects": content_objects})
 
+    except sheets_http.ThrottledError as e:
+        log.warning("/content throttled: %s", e)
+        return Response.error(str(e))
     except Exception as e:
-        print(f"DEBUG: /content error = {e}")
-        print(f"DEBUG: Full traceback = {traceback.format_exc()}")
+        log.warning("/content error = %s", e)
+        log.debug("Full traceback = %s", traceback.format_exc())
         return Response(data={"content_objects": []})
 
+def execute_bulk(sheet_id, sheet_name, rows, service_account_json):
+    """
+    Bulk mode: append every entry of rows (a row_data array, or {"row_data": [...]})
+    with as few values:append calls as the chunk bounds allow.
+    """
+    rows_values = []
+    for position, row in enumerate(rows):
+        row_data = row.get("row_data", []) if isinstance(row, dict) else row
+        row_values = parse_row_values(row_data if isinstance(row_data, list) else [])
+        if not row_values:
+            return Response.error(f"No valid row data provided for row {position + 1}")
+        rows_values.append(row_values)
+
+    log.debug("Bulk append of %s row(s)", len(rows_values))
+
+    success, message, chunk_results = append_rows(
+        spreadsheet_id=sheet_id,
+        sheet_name=sheet_name,
+        rows=rows_values,
+        service_account_json=service_account_json
+    )
+
+    if not success:
+        return Response.error(message)
+
+    rows_added = sum(result["rows"] for result in chunk_results)
+    return Response(
+        data={
+            "sheet_id": sheet_id,
+            "sheet_name": sheet_name,
+            "rows_added": rows_added,
+            "chunks": chunk_results,
+            "message": message
+        },
+        metadata={
+            "affected_records": rows_added,
+            "message": f"Successfully added {rows_added} row(s) to sheet '{sheet_name}'"
+        }
+    )
+
 @router.route("/execute", methods=["POST"])
 def execute():
     """
@@ -390,13 +434,13 @@ def execute():
     Adds a new row with data to the specified Google Sheet.
     """
     try:
-        print("DEBUG: add_row_to_sheet /execute called")
+        log.debug("add_row_to_sheet /execute called")
         
         # Parse the request
         request = Request(flask_request)
         data = request.data
 
-        print(f"DEBUG: Parsed data = {data}")
+        log.debug("Parsed data = %s", data)
         
         # Get required parameters
         sheet_id = data.get("sheet_id", "")
@@ -404,6 +448,7 @@ def execute():
         sheet_name_obj = data.get("sheet_name", "")
         row_data = data.get("row_data", [])
         target_row = data.get("target_row")
+        rows = data.get("rows", [])
         
         # Handle sheet_name - could be string, object from dropdown, or direct value
         sheet_name = ""
@@ -412,11 +457,11 @@ def execute():
         elif isinstance(sheet_name_obj, str):
             sheet_name = sheet_name_obj
         
-        print(f"DEBUG: Raw sheet_name_obj = {sheet_name_obj}")
-        print(f"DEBUG: Processed sheet_name = {sheet_name}")
-        print(f"DEBUG: row_data = {row_data}")
-        print(f"DEBUG: target_row = {target_row}")
-        print(f"DEBUG: service_account_json = {'[PROVIDED]' if service_account_json else '[NOT PROVIDED]'}")
+        log.debug("Raw sheet_name_obj = %s", sheet_name_obj)
+        log.debug("Processed sheet_name = %s", sheet_name)
+        log.debug("row_data = %s", row_data)
+        log.debug("target_row = %s", target_row)
+        log.debug("service_account_json = %s", '[PROVIDED]' if service_account_json else '[NOT PROVIDED]')
         
         if not sheet_id:
             return Response.error("Sheet ID is required")
@@ -427,22 +472,19 @@ def execute():
         if not sheet_name:
             return Response.error("Sheet name is required")
         
+        if rows:
+            return execute_bulk(sheet_id, sheet_name, rows, service_account_json)
+
         if not row_data:
             return Response.error("Row data is required")
 
         # Extract values from row_data array
-        row_values = []
-        for item in row_data:
-            if isinstance(item, dict):
-                column_value = item.get("column_value", "")
-                row_values.append(str(column_value))
-            elif isinstance(item, str):
-                row_values.append(item)
+        row_values = parse_row_values(row_data)
         
         if not row_values:
             return Response.error("No valid row data provided")
         
-        print(f"DEBUG: Processed row_values = {row_values}")
+        log.debug("Processed row_values = %s", row_values)
 
         # Add row to sheet using service account
         success, message = add_row_with_service_account(
@@ -475,6 +517,6 @@ def execute():
         )
                 
     except Exception as e:
-        print(f"DEBUG: /execute error = {e}")
-        print(f"DEBUG: Execute traceback = {traceback.format_exc()}")
+        log.warning("/execute error = %s", e)
+        log.debug("Execute traceback = %s", traceback.format_exc())
         return Response.error(str(e))
@@ -1,6 +1,7 @@
 from flask import request as flask_request
 from workflows_cdk import Response, Request
 from main import router
+from src.common import sheets_auth, sheets_http, sheets_metadata
 import json
 
 import os
@@ -24,17 +25,11 @@ def execute():
             return Response.error("Service account JSON is required (from env)")
         if not tab_sheet_name:
             return Response.error("Tab Sheet Name is required")
-        # Import inside function to avoid PyO3 re-init error
-        from google.oauth2 import service_account
-        from google.auth.transport.requests import Request as GoogleRequest
-        account_info = SERVICE_ACCOUNT_JSON
         scopes = [
             "https://www.googleapis.com/auth/spreadsheets",
             "https://www.googleapis.com/auth/drive"
         ]
-        creds = service_account.Credentials.from_service_account_info(account_info, scopes=scopes)
-        creds.refresh(GoogleRequest())
-        token = creds.token
+        token = sheets_auth.get_access_token(scopes, SERVICE_ACCOUNT_JSON)
         # Prepare the request to add a new tab (sheet) to an existing spreadsheet
         url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}:batchUpdate"
         headers = {
@@ -46,8 +41,7 @@ def execute():
                 {"addSheet": {"properties": {"title": tab_sheet_name}}}
             ]
         }
-        import requests
-        resp = requests.post(url, headers=headers, json=body, timeout=30)
+        resp = sheets_http.post(url, headers=headers, json=body, timeout=30)
         if resp.status_code not in [200, 201]:
             try:
                 error_json = resp.json()
@@ -55,6 +49,8 @@ def execute():
             except Exception:
                 error_detail = resp.text
             return Response.error(f"Failed to create tab: {error_detail}")
+        # The tab list changed, so cached metadata for this spreadsheet is stale
+        sheets_metadata.invalidate(sheet_id)
         result = resp.json()
         new_tab_id = result.get("replies", [{}])[0].get("addSheet", {}).get("properties", {}).get("sheetId")
         return Response(data={
@@ -1,80 +1,57 @@
 from flask import request as flask_request
 from workflows_cdk import Response, Request
 from main import router
-import requests
-from urllib.parse import quote
+from src.common import app_log, content_fanout, sheets_auth, sheets_http, sheets_key_index, sheets_metadata, sheets_ranges, sheets_values
 import os
 import json
 
+log = app_log.get_logger(__name__)
+
 # === ENVIRONMENT VARIABLES ===
 API_KEY = os.environ.get("GOOGLE_SHEETS_API_KEY")
 SERVICE_ACCOUNT_JSON_STR = os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON")
 SERVICE_ACCOUNT_JSON = json.loads(SERVICE_ACCOUNT_JSON_STR) if SERVICE_ACCOUNT_JSON_STR else None
+MAX_DELETE_REQUESTS_PER_BATCH = int(os.environ.get("SHEETS_MAX_DELETE_REQUESTS_PER_BATCH", "1000"))
 # === END ENVIRONMENT VARIABLES ===
 
-def get_sheets_with_api_v4(spreadsheet_id):
-    try:
-        metadata_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}?key={API_KEY}"
-        response = requests.get(metadata_url, timeout=10)
-        if response.status_code != 200:
-            return []
-        metadata = response.json()
-        sheets = metadata.get('sheets', [])
-        return [{"name": s['properties']['title'], "gid": s['properties']['sheetId']} for s in sheets]
-    except Exception as e:
-        print(f"DEBUG: get_sheets_with_api_v4 failed: {str(e)}")
-        return []
-
 def get_sheet_header(spreadsheet_id, sheet_name):
     try:
-        range_string = f"{sheet_name}!1:1"
-        encoded_range = quote(range_string)
-        url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{encoded_range}?key={API_KEY}"
-        resp = requests.get(url, timeout=10)
-        if resp.status_code != 200:
-            return []
-        data = resp.json().get("values", [])
-        if not data:
-            return []
-        return data[0]
+        return sheets_values.get_header(spreadsheet_id, sheet_name, API_KEY)
+    except sheets_http.ThrottledError:
+        raise
     except Exception as e:
-        print(f"DEBUG: get_sheet_header failed: {str(e)}")
+        log.warning("get_sheet_header failed: %s", e)
         return []
 
-def get_column_values(spreadsheet_id, sheet_name, key_column):
+def get_column_values(spreadsheet_id, sheet_name, key_column, search="", limit=None, offset=0):
+    """
+    Return (options, total) for one page of distinct key values, served from the
+    cached key index (header row plus key column only).
+    """
     try:
-        range_string = f"{sheet_name}"
-        encoded_range = quote(range_string)
-        url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{encoded_range}?key={API_KEY}"
-        resp = requests.get(url, timeout=10)
-        all_values = resp.json().get("values", [])
-        if not all_values or len(all_values) < 2:
-            return []
-        header = all_values[0]
-        if key_column not in header:
-            return []
-        col_idx = header.index(key_column)
-        value_options = []
-        seen = set()
-        for row in all_values[1:]:
-            val = row[col_idx] if col_idx < len(row) else ""
-            if val and val not in seen:
-                value_options.append({"value": {"id": val, "label": str(val)}, "label": str(val)})
-                seen.add(val)
-        return value_options
+        values, total = sheets_key_index.distinct_values(
+            spreadsheet_id, sheet_name, key_column, API_KEY, search=search, limit=limit, offset=offset
+        )
+        value_options = [{"value": {"id": val, "label": str(val)}, "label": str(val)} for val in values]
+        return value_options, total
+    except sheets_http.ThrottledError:
+        raise
     except Exception as e:
-        print(f"DEBUG: get_column_values failed: {str(e)}")
-        return []
+        log.warning("get_column_values failed: %s", e)
+        return [], 0
 
-def get_sheet_id(spreadsheet_id, sheet_name):
-    # Helper to get the numeric sheetId for batchUpdate
-    sheets = get_sheets_with_api_v4(spreadsheet_id)
-    for s in sheets:
-        if s["name"] == sheet_name:
-            return s["gid"]
-    return 0
+def get_page_param(content_name, form_data, name, default):
+    """
+    Read a non-negative integer paging parameter from the content object request or the form.
+    """
+    value = content_name.get(name, form_data.get(f"key_values_{name}"))
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return default
 
 @router.route("/content", methods=["POST"])
+@sheets_http.request_scoped_fetches
 def content():
     try:
         request = Request(flask_request)
@@ -93,38 +70,61 @@ def content():
             key_column = key_column_obj.get("id", "") or key_column_obj.get("label", "") or key_column_obj.get("value", "")
         elif isinstance(key_column_obj, str):
             key_column = key_column_obj
+        if not key_column:
+            # The form picks the key column per condition; suggest values for the last one set
+            for condition in reversed(form_data.get("conditions") or []):
+                condition_column = condition.get("key_column", "") if isinstance(condition, dict) else ""
+                if isinstance(condition_column, dict):
+                    condition_column = condition_column.get("id", "") or condition_column.get("label", "") or condition_column.get("value", "")
+                if condition_column:
+                    key_column = condition_column
+                    break
         content_object_names = data.get("content_object_names", [])
-        content_objects = []
-        for content_name in content_object_names:
+        def resolve_content_object(content_name):
             cid = content_name.get("id")
             if cid == "sheet_names":
                 if not sheet_id:
-                    content_objects.append({"content_object_name": "sheet_names", "data": []})
-                    continue
-                available_sheets = get_sheets_with_api_v4(sheet_id)
+                    return {"content_object_name": "sheet_names", "data": []}
+                available_sheets = sheets_metadata.get_sheets(sheet_id, API_KEY)
                 sheet_options = [{"value": {"id": s["name"], "label": s["name"]}, "label": s["name"]} for s in available_sheets]
-                content_objects.append({"content_object_name": "sheet_names", "data": sheet_options})
+                return {"content_object_name": "sheet_names", "data": sheet_options}
             elif cid == "column_names":
                 if not sheet_id or not sheet_name:
-                    content_objects.append({"content_object_name": "column_names", "data": []})
-                    continue
+                    return {"content_object_name": "column_names", "data": []}
                 header = get_sheet_header(sheet_id, sheet_name)
                 options = [{"value": {"id": col, "label": col}, "label": col} for col in header]
-                content_objects.append({"content_object_name": "column_names", "data": options})
+                return {"content_object_name": "column_names", "data": options}
             elif cid == "key_columns":
                 if not sheet_id or not sheet_name:
-                    content_objects.append({"content_object_name": "key_columns", "data": []})
-                    continue
+                    return {"content_object_name": "key_columns", "data": []}
                 header = get_sheet_header(sheet_id, sheet_name)
                 options = [{"value": {"id": col, "label": col}, "label": col} for col in header]
-                content_objects.append({"content_object_name": "key_columns", "data": options})
+                return {"content_object_name": "key_columns", "data": options}
             elif cid == "key_values":
                 if not sheet_id or not sheet_name or not key_column:
-                    content_objects.append({"content_object_name": "key_values", "data": []})
-                    continue
-                value_options = get_column_values(sheet_id, sheet_name, key_column)
-                content_objects.append({"content_object_name": "key_values", "data": value_options})
+                    return {"content_object_name": "key_values", "data": []}
+                # Prefix search and paging, from the content object request or the
+                # key_values_search/limit/offset form fields; pages hold at most
+                # SHEETS_KEY_VALUES_PAGE_SIZE values by default
+                search = str(content_name.get("search", form_data.get("key_values_search", "")) or "")
+                limit = get_page_param(content_name, form_data, "limit", None)
+                offset = get_page_param(content_name, form_data, "offset", 0)
+                value_options, total = get_column_values(sheet_id, sheet_name, key_column, search, limit, offset)
+                next_offset = offset + len(value_options)
+                return {
+                    "content_object_name": "key_values",
+                    "data": value_options,
+                    "pagination": {
+                        "offset": offset,
+                        "total": total,
+                        "next_offset": next_offset if next_offset < total else None
+                    }
+                }
+
+        content_objects = content_fanout.resolve_in_order(content_object_names, resolve_content_object)
         return Response(data={"content_objects": content_objects})
+    except sheets_http.ThrottledError as e:
+        return Response.error(str(e))
     except Exception as e:
         return Response(data={"content_objects": []})
 
@@ -163,57 +163,58 @@ def execute():
             return Response.error("Sheet name is required")
         if not key_column or not key_value:
             return Response.error("Key column and key value are required")
-        range_string = f"{sheet_name}"
-        encoded_range = quote(range_string)
-        url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}/values/{encoded_range}?key={API_KEY}"
-        resp = requests.get(url, timeout=10)
-        all_values = resp.json().get("values", [])
-        if not all_values or len(all_values) < 2:
+        # Look the rows up in the shared key index instead of reading the whole tab
+        header, rows_to_delete = sheets_key_index.find_rows(sheet_id, sheet_name, key_column, key_value, API_KEY)
+        if not header:
             return Response.error("Could not fetch sheet data to determine rows to delete.")
-        header = all_values[0]
-        if key_column not in header:
+        if rows_to_delete is None:
             return Response.error(f"Key column '{key_column}' not found in header: {header}")
-        key_col_idx = header.index(key_column)
-        rows_to_delete = []
-        for i, row in enumerate(all_values[1:], start=2):
-            val = row[key_col_idx] if key_col_idx < len(row) else ""
-            if val == key_value:
-                rows_to_delete.append(i)
         if not rows_to_delete:
             return Response.error(f"No rows found where '{key_column}' == '{key_value}'")
+        # Resolve the numeric tab id once for every deleteDimension request
+        gid = sheets_metadata.get_sheet_gid(sheet_id, sheet_name, API_KEY)
+        if gid is None:
+            return Response.error(f"Could not resolve tab id for sheet '{sheet_name}'")
         # Use batchUpdate to delete rows
-        from google.oauth2 import service_account
-        from google.auth.transport.requests import Request as GoogleRequest
-        account_info = service_account_json
-        scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-        creds = service_account.Credentials.from_service_account_info(account_info, scopes=scopes)
-        creds.refresh(GoogleRequest())
-        token = creds.token
+        token = sheets_auth.get_access_token(sheets_auth.SPREADSHEETS_SCOPES, service_account_json)
         batch_url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}:batchUpdate"
-        # Prepare delete requests (reverse order to avoid shifting rows)
-        requests_body = []
-        for row_num in sorted(rows_to_delete, reverse=True):
-            requests_body.append({
-                "deleteDimension": {
-                    "range": {
-                        "sheetId": get_sheet_id(sheet_id, sheet_name),
-                        "dimension": "ROWS",
-                        "startIndex": row_num-1,
-                        "endIndex": row_num
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        # One request per contiguous run of rows, bottom-most first to avoid shifting rows
+        spans = list(reversed(sheets_ranges.coalesce_runs(rows_to_delete)))
+        rows_deleted = 0
+        for span_chunk in sheets_ranges.chunked(spans, MAX_DELETE_REQUESTS_PER_BATCH):
+            requests_body = [
+                {
+                    "deleteDimension": {
+                        "range": {
+                            "sheetId": gid,
+                            "dimension": "ROWS",
+                            "startIndex": first_row - 1,
+                            "endIndex": last_row
+                        }
                     }
                 }
-            })
-        body = {"requests": requests_body}
-        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-        resp = requests.post(batch_url, headers=headers, json=body, timeout=30)
-        if resp.status_code not in [200, 201]:
-            error_detail = resp.text
-            try:
-                error_json = resp.json()
-                error_detail = error_json.get("error", {}).get("message", resp.text)
-            except:
-                pass
-            return Response.error(f"Failed to delete rows: {error_detail}")
-        return Response(data={"message": f"Deleted {len(rows_to_delete)} row(s) where {key_column} == {key_value}."})
+                for first_row, last_row in span_chunk
+            ]
+            body = {"requests": requests_body}
+            resp = sheets_http.post(batch_url, headers=headers, json=body, timeout=30)
+            if resp.status_code not in [200, 201]:
+                error_detail = resp.text
+                try:
+                    error_json = resp.json()
+                    error_detail = error_json.get("error", {}).get("message", resp.text)
+                except:
+                    pass
+                return Response.error(f"Failed to delete rows after deleting {rows_deleted} row(s): {error_detail}")
+            # Chunks go bottom-up, so this chunk's deletes never shift the rows of the next one
+            deleted_rows = [row for first_row, last_row in span_chunk for row in range(first_row, last_row + 1)]
+            sheets_key_index.record_delete(sheet_id, sheet_name, deleted_rows)
+            sheets_metadata.invalidate(sheet_id)
+            rows_deleted += len(deleted_rows)
+        return Response(data={
+            "message": f"Deleted {rows_deleted} row(s) where {key_column} == {key_value}.",
+            "rows_deleted": rows_deleted,
+            "ranges_deleted": len(spans)
+        })
     except Exception as e:
         return Response.error(str(e))
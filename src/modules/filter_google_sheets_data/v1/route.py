@@ -2,97 +2,44 @@ from flask import request as flask_request
 from workflows_cdk import Response, Request
 from main import router
 import requests
+from src.common import app_log, content_fanout, sheets_filters, sheets_http, sheets_metadata, sheets_values
 import traceback
 from urllib.parse import quote
 
-print("DEBUG: filter_google_sheets_data/v1/route.py is being loaded!")
+log = app_log.get_logger(__name__)
+
+log.debug("filter_google_sheets_data/v1/route.py is being loaded!")
 
 import os
 
 # === ENVIRONMENT VARIABLES ===
 API_KEY = os.environ.get("GOOGLE_SHEETS_API_KEY")
+# Default filter evaluation mode: "row" or "columnar" (vectorized, needs numpy)
+FILTER_MODE = os.environ.get("SHEETS_FILTER_MODE", "row")
+# Default fetch mode: "full" (download every row) or "projection" (filtered columns first)
+FETCH_MODE = os.environ.get("SHEETS_FILTER_FETCH_MODE", "full")
 # === END ENVIRONMENT VARIABLES ===
 
-def get_sheets_with_api_v4(spreadsheet_id, api_key=None):
-    """
-    Use Google Sheets API v4 to get sheet information.
-    """
-    try:
-        print(f"DEBUG: get_sheets_with_api_v4 called with spreadsheet_id={spreadsheet_id}, api_key={'[PROVIDED]' if api_key else '[MISSING]'}")
-        if not api_key:
-            print("DEBUG: API key is missing")
-            return []
-        # Defensive: If spreadsheet_id is empty, return []
-        if not spreadsheet_id:
-            print("DEBUG: spreadsheet_id is missing")
-            return []
-        metadata_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}?key={api_key}"
-        print(f"DEBUG: Fetching metadata from Sheets API v4: {metadata_url}")
-        try:
-            response = requests.get(metadata_url, timeout=10)
-        except requests.exceptions.ReadTimeout:
-            print("DEBUG: Google Sheets API request timed out")
-            return []
-        except Exception as e:
-            print(f"DEBUG: Google Sheets API request failed: {str(e)}")
-            return []
-        print(f"DEBUG: API response status code: {response.status_code}")
-        if response.status_code != 200:
-            print(f"DEBUG: API returned non-200 status: {response.status_code}")
-            print(f"DEBUG: API response text: {response.text}")
-            return []
-        metadata = response.json()
-        print(f"DEBUG: API response JSON keys: {list(metadata.keys())}")
-        sheets = metadata.get('sheets', [])
-        print(f"DEBUG: Found {len(sheets)} sheets in metadata")
-        available_sheets = []
-        for i, sheet in enumerate(sheets):
-            properties = sheet.get('properties', {})
-            sheet_name = properties.get('title', 'Unknown')
-            sheet_id = properties.get('sheetId', 0)
-            available_sheets.append({
-                "name": sheet_name,
-                "gid": sheet_id
-            })
-            print(f"DEBUG: Sheet {i+1}: {sheet_name} (GID: {sheet_id})")
-        print(f"DEBUG: get_sheets_with_api_v4 returning {len(available_sheets)} sheets")
-        return available_sheets
-    except Exception as e:
-        print(f"DEBUG: Sheets API v4 failed with general Exception: {str(e)}")
-        print(f"DEBUG: General exception traceback: {traceback.format_exc()}")
-        return []
-
-def get_sheet_data_with_api_v4(spreadsheet_id, sheet_name, api_key):
+def get_sheet_data_with_api_v4(spreadsheet_id, sheet_name, api_key, first_row=1, last_row=None):
     """
     Get sheet data using Sheets API v4.
+    Rows are read in fixed-size chunks until last_row or the end of the data.
     """
     try:
         if not api_key:
             return None
         
-        # Get all data from the sheet
-        range_string = f"{sheet_name}!A1:ZZ1000"
-        
-        print(f"DEBUG: Using range string: {range_string}")
-        
-        # URL encode the range to handle spaces and special characters
-        encoded_range = quote(range_string)
-        
-        data_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{encoded_range}?key={api_key}"
-        
-        print(f"DEBUG: Fetching data from Sheets API v4: {data_url}")
+        log.debug("Reading rows %s..%s from '%s'", first_row, last_row or 'end', sheet_name)
         
-        response = requests.get(data_url, headers={}, timeout=30)
-        response.raise_for_status()
+        values = sheets_values.fetch_rows(spreadsheet_id, sheet_name, api_key, first_row, last_row)
         
-        data = response.json()
-        values = data.get('values', [])
-        
-        print(f"DEBUG: API v4 returned {len(values)} rows")
+        log.debug("API v4 returned %s rows", len(values))
         return values
         
+    except sheets_http.ThrottledError:
+        raise
     except requests.RequestException as e:
-        print(f"DEBUG: Sheets API v4 data fetch failed: {str(e)}")
+        log.warning("Sheets API v4 data fetch failed: %s", e)
         return None
 
 def filter_data_by_value(data_rows, headers, filter_value):
@@ -116,77 +63,83 @@ def filter_data_by_value(data_rows, headers, filter_value):
         if row_contains_value:
             filtered_rows.append(row)
     
-    print(f"DEBUG: Filtered {len(data_rows)} rows down to {len(filtered_rows)} rows containing '{filter_value}'")
+    log.debug("Filtered %s rows down to %s rows containing '%s'", len(data_rows), len(filtered_rows), filter_value)
     return filtered_rows
 
-def filter_rows_by_operator(data_rows, headers, filter_obj):
+def filter_rows(indexed_rows, headers, filters, filter_logic="AND", evaluation_mode="row"):
     """
-    Filter rows based on a single filter object: column, operator, value.
-    Supports both string and object forms for column/operator keys.
+    Filter (row_number, row) pairs with the whole filters array.
+    In "row" mode the filters are compiled once into a single predicate and applied
+    in one pass over the rows; "columnar" mode evaluates them as vectorized column
+    masks. Both return the same rows (see src/common/sheets_filters.py).
     """
-    if not filter_obj or not data_rows or not headers:
-        return data_rows
-    # Support both 'column' and 'column_name' keys
-    column = filter_obj.get("column") or filter_obj.get("column_name")
-    operator = filter_obj.get("operator")
-    value = filter_obj.get("value")
-    # operator may be object or string
-    if isinstance(operator, dict):
-        operator_val = operator.get("id") or operator.get("label") or operator.get("value")
-    else:
-        operator_val = operator
-    # column may be object or string
-    if isinstance(column, dict):
-        column_name = column.get("id") or column.get("label") or column.get("value")
+    if not filters or not indexed_rows or not headers:
+        return indexed_rows
+    if evaluation_mode == "columnar":
+        filtered = sheets_filters.filter_indexed_rows_columnar(indexed_rows, headers, filters, filter_logic)
     else:
-        column_name = column
-    if not column_name or not operator_val:
-        return data_rows
-    if column_name not in headers:
-        return data_rows
-    col_idx = headers.index(column_name)
-    filtered = []
-    for row in data_rows:
-        cell = row[col_idx] if col_idx < len(row) else ""
-        try:
-            # Try to convert both to float for numeric comparison, else fallback to string
-            cell_val = float(cell)
-            filter_val = float(value)
-        except (ValueError, TypeError):
-            cell_val = str(cell)
-            filter_val = str(value)
-        match = False
-        if operator_val == "=":
-            match = cell_val == filter_val
-        elif operator_val == "!=":
-            match = cell_val != filter_val
-        elif operator_val == ">":
-            match = cell_val > filter_val
-        elif operator_val == "<":
-            match = cell_val < filter_val
-        elif operator_val == ">=":
-            match = cell_val >= filter_val
-        elif operator_val == "<=":
-            match = cell_val <= filter_val
-        if match:
-            filtered.append(row)
-    print(f"DEBUG: filter_rows_by_operator: Filtered {len(data_rows)} rows down to {len(filtered)} using {column_name} {operator_val} {value}")
+        filtered = sheets_filters.filter_indexed_rows(indexed_rows, headers, filters, filter_logic)
+    log.debug("filter_rows: Filtered %s rows down to %s using %s filter(s) (%s, %s)", len(indexed_rows), len(filtered), len(filters), filter_logic, evaluation_mode)
     return filtered
 
+def filter_rows_with_projection(spreadsheet_id, sheet_name, api_key, headers, filters, filter_logic="AND", evaluation_mode="row"):
+    """
+    Two-phase filtering that only downloads what the filters need:
+    1. fetch just the filtered columns (values:batchGet) and evaluate the filters on them,
+    2. fetch the full rows for the matching row numbers as merged contiguous ranges.
+    Returns (filtered (row_number, row) pairs, number of data rows in the tab),
+    the same rows and count a full download followed by filter_rows would give.
+    """
+    col_indexes = [resolved[0] for resolved in (sheets_filters.resolve_filter(f, headers) for f in filters) if resolved]
+    if not col_indexes:
+        # No usable filter, so every row matches and there is nothing to project
+        all_rows = sheets_values.fetch_rows(spreadsheet_id, sheet_name, api_key, 2)
+        return list(enumerate(all_rows, start=2)), len(all_rows)
+    # Phase 1: filtered columns only, rebuilt into rows holding just those cells
+    columns = sheets_values.fetch_columns(spreadsheet_id, sheet_name, api_key, col_indexes)
+    extent = max(len(cells) for cells in columns.values())
+    width = max(col_indexes) + 1
+    projected_rows = []
+    for i in range(extent):
+        row = [""] * width
+        for col_idx, cells in columns.items():
+            if i < len(cells):
+                row[col_idx] = cells[i]
+        projected_rows.append((i + 2, row))
+    matched_numbers = [row_number for row_number, _ in filter_rows(projected_rows, headers, filters, filter_logic, evaluation_mode)]
+    # Rows below the filtered columns' last value have blank filtered cells, so they
+    # match exactly when a blank row matches; only then do they have to be read
+    tail_rows = []
+    if sheets_filters.compile_filters(filters, headers, filter_logic)([]):
+        tail_rows = sheets_values.fetch_rows(spreadsheet_id, sheet_name, api_key, extent + 2)
+    # Phase 2: full rows for the matches only
+    full_rows = sheets_values.fetch_row_spans(spreadsheet_id, sheet_name, api_key, matched_numbers) if matched_numbers else {}
+    filtered = [(row_number, full_rows.get(row_number, [])) for row_number in matched_numbers]
+    filtered.extend(enumerate(tail_rows, start=extent + 2))
+    log.debug("Projection read %s column(s) over %s rows, then %s matching row(s) and %s trailing row(s)", len(col_indexes), extent, len(matched_numbers), len(tail_rows))
+    total_rows = extent + len(tail_rows)
+    if not tail_rows:
+        # Other columns may run deeper than the filtered ones; count their rows as
+        # full mode does, with a small probe instead of reading them
+        last_row = sheets_metadata.find_last_row(spreadsheet_id, sheet_name, api_key, extent + 2)
+        total_rows = max(total_rows, (last_row or 0) - 1)
+    return filtered, total_rows
+
 @router.route("/content", methods=["POST"])
+@sheets_http.request_scoped_fetches
 def content():
     """
     Provide dynamic content for the module UI.
     Fetches sheet information from Google Sheets using API key and sheet ID.
     """
     try:
-        print("DEBUG: filter_google_sheets_data /content called")
+        log.debug("filter_google_sheets_data /content called")
 
         # Parse the request
         request = Request(flask_request)
         data = request.data
 
-        print(f"DEBUG: Parsed data = {data}")
+        log.debug("Parsed data = %s", data)
 
         # Get required parameters from form_data
         form_data = data.get("form_data", {})
@@ -196,43 +149,40 @@ def content():
 
         # Get requested content objects
         content_object_names = data.get("content_object_names", [])
-        content_objects = []
 
-        print(f"DEBUG: Content object names requested = {content_object_names}")
-        print(f"DEBUG: sheet_id = {sheet_id}")
-        print(f"DEBUG: api_key = {'[PROVIDED]' if api_key else '[NOT PROVIDED]'}")
+        log.debug("Content object names requested = %s", content_object_names)
+        log.debug("sheet_id = %s", sheet_id)
+        log.debug("api_key = %s", '[PROVIDED]' if api_key else '[NOT PROVIDED]')
 
         # Process each requested content object
-        for content_name in content_object_names:
+        def resolve_content_object(content_name):
             cid = content_name.get("id")
             if cid == "sheet_names":
-                print("DEBUG: Processing sheet_names content object")
+                log.debug("Processing sheet_names content object")
                 # Defensive: Try to get sheet_id from form_data or fallback to data
                 sheet_id_for_dropdown = sheet_id or data.get("sheet_id", "")
                 if not sheet_id_for_dropdown or not api_key:
-                    print("DEBUG: Missing sheet_id or api_key, returning empty sheet_names")
-                    content_objects.append({
+                    log.debug("Missing sheet_id or api_key, returning empty sheet_names")
+                    return {
                         "content_object_name": "sheet_names",
                         "data": []
-                    })
-                    continue
-                available_sheets = get_sheets_with_api_v4(sheet_id_for_dropdown, api_key)
+                    }
+                available_sheets = sheets_metadata.get_sheets(sheet_id_for_dropdown, api_key)
                 sheet_options = [
                     {"value": {"id": s["name"], "label": s["name"]}, "label": s["name"]}
                     for s in available_sheets
                 ]
-                content_objects.append({
+                return {
                     "content_object_name": "sheet_names",
                     "data": sheet_options
-                })
+                }
             elif cid == "column_names":
-                print("DEBUG: Processing column_names content object")
+                log.debug("Processing column_names content object")
                 if not sheet_id:
-                    content_objects.append({
+                    return {
                         "content_object_name": "column_names",
                         "data": []
-                    })
-                    continue
+                    }
                 # Try to get the first available sheet name if not provided
                 sheet_name_val = form_data.get("sheet_name", "")
                 sheet_name = ""
@@ -242,7 +192,7 @@ def content():
                     sheet_name = sheet_name_val
                 if not sheet_name:
                     # fallback: use the first available sheet
-                    sheets = get_sheets_with_api_v4(sheet_id, api_key)
+                    sheets = sheets_metadata.get_sheets(sheet_id, api_key)
                     if sheets:
                         sheet_name = sheets[0]["name"]
                 header = []
@@ -251,23 +201,25 @@ def content():
                         range_string = f"{sheet_name}!1:1"
                         encoded_range = quote(range_string)
                         url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}/values/{encoded_range}?key={api_key}"
-                        resp = requests.get(url, timeout=10)
+                        resp = sheets_http.get(url, timeout=10)
                         if resp.status_code == 200:
-                            data = resp.json().get("values", [])
-                            if data:
-                                header = data[0]
+                            values = resp.json().get("values", [])
+                            if values:
+                                header = values[0]
+                    except sheets_http.ThrottledError:
+                        raise
                     except Exception as e:
-                        print(f"DEBUG: Failed to fetch column names: {str(e)}")
+                        log.warning("Failed to fetch column names: %s", e)
                 column_options = [
                     {"value": {"id": col, "label": col}, "label": col}
                     for col in header
                 ]
-                content_objects.append({
+                return {
                     "content_object_name": "column_names",
                     "data": column_options
-                })
+                }
             elif cid == "operator":
-                print("DEBUG: Processing operator content object")
+                log.debug("Processing operator content object")
                 # Static options as per schema.json
                 operator_options = [
                     {"value": "=", "label": "="},
@@ -277,16 +229,21 @@ def content():
                     {"value": ">=", "label": ">="},
                     {"value": "<=", "label": "<="}
                 ]
-                content_objects.append({
+                return {
                     "content_object_name": cid,
                     "data": operator_options
-                })
-        print(f"DEBUG: Returning {len(content_objects)} content objects")
-        print(f"DEBUG: Content objects = {content_objects}")
+                }
+
+        content_objects = content_fanout.resolve_in_order(content_object_names, resolve_content_object)
+        log.debug("Returning %s content objects", len(content_objects))
+        log.debug("Content objects = %s", content_objects)
         return Response(data={"content_objects": content_objects})
+    except sheets_http.ThrottledError as e:
+        log.warning("/content throttled: %s", e)
+        return Response.error(str(e))
     except Exception as e:
-        print(f"DEBUG: /content error = {e}")
-        print(f"DEBUG: Full traceback = {traceback.format_exc()}")
+        log.warning("/content error = %s", e)
+        log.debug("Full traceback = %s", traceback.format_exc())
         return Response(data={"content_objects": []})
 
 @router.route("/execute", methods=["POST"])
@@ -296,63 +253,83 @@ def execute():
     Fetches data from specified sheet and filters rows using the specified operator and column.
     """
     try:
-        print("DEBUG: filter_google_sheets_data /execute called")
+        log.debug("filter_google_sheets_data /execute called")
         # Parse the request
         request = Request(flask_request)
         data = request.data
-        print(f"DEBUG: Parsed data = {data}")
+        log.debug("Parsed data = %s", data)
         # Get required parameters
         sheet_id = data.get("sheet_id", "")
         api_key = API_KEY
         sheet_name_obj = data.get("sheet_name", "")
         filters = data.get("filters", [])
+        filter_logic = sheets_filters.option_value(data.get("filter_logic")) or "AND"
+        evaluation_mode = sheets_filters.option_value(data.get("evaluation_mode")) or FILTER_MODE
+        fetch_mode = sheets_filters.option_value(data.get("fetch_mode")) or FETCH_MODE
         # Handle sheet_name - could be string, object from dropdown, or direct value
         sheet_name = ""
         if isinstance(sheet_name_obj, dict):
             sheet_name = sheet_name_obj.get("id", "") or sheet_name_obj.get("label", "") or sheet_name_obj.get("value", "")
         elif isinstance(sheet_name_obj, str):
             sheet_name = sheet_name_obj
-        print(f"DEBUG: Raw sheet_name_obj = {sheet_name_obj}")
-        print(f"DEBUG: Processed sheet_name = {sheet_name}")
+        log.debug("Raw sheet_name_obj = %s", sheet_name_obj)
+        log.debug("Processed sheet_name = %s", sheet_name)
         if not sheet_id:
             return Response.error("Sheet ID is required")
         if not api_key:
             return Response.error("API key is required")
         if not sheet_name:
             return Response.error("Sheet name is required")
-        if not filters or not isinstance(filters, list) or not filters[0].get("value"):
+        if not filters or not isinstance(filters, list) or not any(f.get("value") for f in filters if isinstance(f, dict)):
             return Response.error("At least one filter with value is required")
-        print(f"DEBUG: sheet_id = {sheet_id}")
-        print(f"DEBUG: sheet_name = {sheet_name}")
-        print(f"DEBUG: api_key = [PROVIDED]")
-        print(f"DEBUG: filters = {filters}")
-        # Get data using API v4
-        api_v4_data = get_sheet_data_with_api_v4(sheet_id, sheet_name, api_key)
-        if not api_v4_data:
-            return Response.error("Failed to fetch data from Google Sheet")
-        if len(api_v4_data) < 1:
-            return Response.error("No data found in the sheet")
-        headers = api_v4_data[0]
-        all_data_rows = api_v4_data[1:]
-        # Apply the first filter (extend to multiple filters if needed)
-        filter_obj = filters[0]
-        filtered_rows = filter_rows_by_operator(all_data_rows, headers, filter_obj)
+        if str(filter_logic).upper() not in ("AND", "OR"):
+            return Response.error("Filter logic must be AND or OR")
+        if evaluation_mode not in ("row", "columnar"):
+            return Response.error("Evaluation mode must be row or columnar")
+        if fetch_mode not in ("full", "projection"):
+            return Response.error("Fetch mode must be full or projection")
+        log.debug("sheet_id = %s", sheet_id)
+        log.debug("sheet_name = %s", sheet_name)
+        log.debug("api_key = [PROVIDED]")
+        log.debug("filters = %s", filters)
+        if fetch_mode == "projection":
+            # Header first, then only the columns the filters touch
+            header_rows = get_sheet_data_with_api_v4(sheet_id, sheet_name, api_key, 1, 1)
+            if not header_rows:
+                return Response.error("Failed to fetch data from Google Sheet")
+            headers = header_rows[0]
+            filtered_rows, total_available_rows = filter_rows_with_projection(
+                sheet_id, sheet_name, api_key, headers, filters, filter_logic, evaluation_mode
+            )
+        else:
+            # Get data using API v4
+            api_v4_data = get_sheet_data_with_api_v4(sheet_id, sheet_name, api_key)
+            if not api_v4_data:
+                return Response.error("Failed to fetch data from Google Sheet")
+            headers = api_v4_data[0]
+            all_data_rows = api_v4_data[1:]
+            total_available_rows = len(all_data_rows)
+            # Pair every row with its sheet row number (+2 because first row is headers)
+            indexed_rows = list(enumerate(all_data_rows, start=2))
+            # Apply every filter in a single pass
+            filtered_rows = filter_rows(indexed_rows, headers, filters, filter_logic, evaluation_mode)
         # Convert to JSON format
         structured_data = []
-        for i, row in enumerate(filtered_rows):
+        for row_number, row in filtered_rows:
             row_dict = {}
             for j, header in enumerate(headers):
                 value = row[j] if j < len(row) else ""
                 row_dict[header] = value
-            row_dict["_row_number"] = all_data_rows.index(row) + 2  # +2 because first row is headers
+            row_dict["_row_number"] = row_number
             structured_data.append(row_dict)
-        print(f"DEBUG: Processed {len(structured_data)} filtered rows from {len(all_data_rows)} total rows")
+        log.debug("Processed %s filtered rows from %s total rows", len(structured_data), total_available_rows)
         # Create response
         result = {
             "sheet_id": sheet_id,
             "sheet_name": sheet_name,
             "filters": filters,
-            "total_available_rows": len(all_data_rows),
+            "filter_logic": str(filter_logic).upper(),
+            "total_available_rows": total_available_rows,
             "filtered_rows": len(filtered_rows),
             "headers": headers,
             "data": structured_data,
@@ -367,6 +344,6 @@ def execute():
             }
         )
     except Exception as e:
-        print(f"DEBUG: /execute error = {e}")
-        print(f"DEBUG: Execute traceback = {traceback.format_exc()}")
+        log.warning("/execute error = %s", e)
+        log.debug("Execute traceback = %s", traceback.format_exc())
         return Response.error(str(e))
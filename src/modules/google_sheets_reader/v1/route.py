@@ -2,14 +2,16 @@ from flask import request as flask_request
 from workflows_cdk import Response, Request
 from main import router
 import requests
+from src.common import app_log, content_fanout, sheets_http, sheets_metadata, sheets_ranges, sheets_values
 import csv
 import io
 import traceback
-from urllib.parse import quote
 import json
 import os
 
-print("DEBUG: google_sheets_reader/v1/route.py is being loaded!")
+log = app_log.get_logger(__name__)
+
+log.debug("google_sheets_reader/v1/route.py is being loaded!")
 
 # === ENVIRONMENT VARIABLES ===
 API_KEY = os.environ.get("GOOGLE_SHEETS_API_KEY")
@@ -24,64 +26,6 @@ def get_first_nonempty(*args):
             return v
     return None
 
-def get_sheets_with_api_v4(spreadsheet_id, api_key=None):
-    """
-    Use Google Sheets API v4 to get sheet information.
-    """
-    try:
-        print(f"DEBUG: get_sheets_with_api_v4 called with spreadsheet_id={spreadsheet_id}, api_key={'[PROVIDED]' if api_key else '[MISSING]'}")
-        
-        if not api_key:
-            print("DEBUG: API key is missing")
-            return []  # Return empty list instead of Response.error
-        
-        # Get spreadsheet metadata to list all sheets
-        metadata_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}?key={api_key}"
-        
-        print(f"DEBUG: Fetching metadata from Sheets API v4: {metadata_url}")
-        
-        response = requests.get(metadata_url, timeout=10)
-        print(f"DEBUG: API response status code: {response.status_code}")
-        
-        if response.status_code != 200:
-            print(f"DEBUG: API returned non-200 status: {response.status_code}")
-            print(f"DEBUG: API response text: {response.text}")
-            return []  # Return empty list instead of raising error
-        
-        response.raise_for_status()
-        
-        metadata = response.json()
-        print(f"DEBUG: API response JSON keys: {list(metadata.keys())}")
-        
-        sheets = metadata.get('sheets', [])
-        print(f"DEBUG: Found {len(sheets)} sheets in metadata")
-        
-        available_sheets = []
-        for i, sheet in enumerate(sheets):
-            properties = sheet.get('properties', {})
-            sheet_name = properties.get('title', 'Unknown')
-            sheet_id = properties.get('sheetId', 0)
-            
-            available_sheets.append({
-                "name": sheet_name,
-                "gid": sheet_id
-            })
-            print(f"DEBUG: Sheet {i+1}: {sheet_name} (GID: {sheet_id})")
-        
-        print(f"DEBUG: get_sheets_with_api_v4 returning {len(available_sheets)} sheets")
-        return available_sheets
-        
-    except requests.RequestException as e:
-        print(f"DEBUG: Sheets API v4 failed with RequestException: {str(e)}")
-        import traceback
-        print(f"DEBUG: RequestException traceback: {traceback.format_exc()}")
-        return []  # Return empty list instead of Response.error
-    except Exception as e:
-        print(f"DEBUG: Sheets API v4 failed with general Exception: {str(e)}")
-        import traceback
-        print(f"DEBUG: General exception traceback: {traceback.format_exc()}")
-        return []  # Return empty list instead of Response.error
-
 def get_sheet_ranges(spreadsheet_id, sheet_name, api_key):
     """
     Get available cell references from a sheet for dynamic population.
@@ -91,37 +35,15 @@ def get_sheet_ranges(spreadsheet_id, sheet_name, api_key):
         if not api_key or not sheet_name:
             return []
         
-        # First, get basic sheet data to determine dimensions
-        encoded_range = quote(f"{sheet_name}!A1:ZZ1000")
-        data_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{encoded_range}?key={api_key}"
-        
-        response = requests.get(data_url, headers={}, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
-        values = data.get('values', [])
-        
-        if not values:
+        # Dimensions come from the cached tab metadata and data extent, not a data download
+        extent = sheets_metadata.get_data_extent(spreadsheet_id, sheet_name, api_key)
+        if not extent or not extent["rows"]:
             return []
         
-        # Determine the actual data dimensions
-        max_row = len(values)
-        max_col = 0
-        for row in values:
-            if len(row) > max_col:
-                max_col = len(row)
+        max_row = extent["rows"]
+        max_col = extent["columns"]
         
-        print(f"DEBUG: Sheet dimensions: {max_row} rows, {max_col} columns")
-        
-        # Helper function to convert column number to letter
-        def col_num_to_letter(col_num):
-            if col_num <= 26:
-                return chr(ord('A') + col_num - 1)
-            else:
-                # For columns beyond Z, use AA, AB, etc.
-                first_letter = chr(ord('A') + (col_num - 1) // 26 - 1)
-                second_letter = chr(ord('A') + (col_num - 1) % 26)
-                return first_letter + second_letter
+        log.debug("Sheet dimensions: %s rows, %s columns", max_row, max_col)
         
         # Generate cell reference options
         ranges = []
@@ -144,7 +66,7 @@ def get_sheet_ranges(spreadsheet_id, sheet_name, api_key):
                     if cell_count >= max_cells_to_show:
                         break
                     
-                    col_letter = col_num_to_letter(col)
+                    col_letter = sheets_ranges.column_letter(col - 1)
                     cell_ref = f"{col_letter}{row}"
                     
                     # Add descriptive labels for common cells
@@ -166,7 +88,7 @@ def get_sheet_ranges(spreadsheet_id, sheet_name, api_key):
             
             # Add some key corner cells if sheet is large
             if max_row > 20 or max_col > 10:
-                last_col_letter = col_num_to_letter(min(max_col, 26))
+                last_col_letter = sheets_ranges.column_letter(max_col - 1)
                 
                 # Add last row, first column
                 ranges.append({
@@ -186,48 +108,60 @@ def get_sheet_ranges(spreadsheet_id, sheet_name, api_key):
                     "label": f"{last_col_letter}{max_row} (Last cell with data)"
                 })
         
-        print(f"DEBUG: Generated {len(ranges)} cell reference options")
+        log.debug("Generated %s cell reference options", len(ranges))
         return ranges
         
+    except sheets_http.ThrottledError:
+        raise
     except Exception as e:
-        print(f"DEBUG: get_sheet_ranges failed: {str(e)}")
+        log.warning("get_sheet_ranges failed: %s", e)
         import traceback
-        print(f"DEBUG: get_sheet_ranges traceback: {traceback.format_exc()}")
+        log.debug("get_sheet_ranges traceback: %s", traceback.format_exc())
         return []
 
-def get_sheet_data_with_api_v4(spreadsheet_id, sheet_name, api_key):
+def get_sheet_data_with_api_v4(spreadsheet_id, sheet_name, api_key, first_row=1, last_row=None):
     """
     Get sheet data using Sheets API v4.
+    Rows are read in fixed-size chunks until last_row or the end of the data.
     """
     try:
         if not api_key:
             return None
         
-        # Get all data from the sheet
-        range_string = f"{sheet_name}!A1:ZZ1000"
-        
-        print(f"DEBUG: Using range string: {range_string}")
-        
-        # URL encode the range to handle spaces and special characters
-        encoded_range = quote(range_string)
+        log.debug("Reading rows %s..%s from '%s'", first_row, last_row or 'end', sheet_name)
         
-        data_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{encoded_range}?key={api_key}"
+        values = sheets_values.fetch_rows(spreadsheet_id, sheet_name, api_key, first_row, last_row)
         
-        print(f"DEBUG: Fetching data from Sheets API v4: {data_url}")
-        
-        response = requests.get(data_url, headers={}, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
-        values = data.get('values', [])
-        
-        print(f"DEBUG: API v4 returned {len(values)} rows")
+        log.debug("API v4 returned %s rows", len(values))
         return values
         
+    except sheets_http.ThrottledError:
+        raise
     except requests.RequestException as e:
-        print(f"DEBUG: Sheets API v4 data fetch failed: {str(e)}")
+        log.warning("Sheets API v4 data fetch failed: %s", e)
         return None
 
+def get_header_and_rows(spreadsheet_id, sheet_name, api_key, first_data_row=2, row_count=None):
+    """
+    Read the header row plus row_count data rows starting at sheet row first_data_row.
+    All remaining rows are read when row_count is None.
+    Returns (headers, rows), or (None, None) if the data could not be fetched.
+    """
+    last_row = first_data_row + row_count - 1 if row_count is not None else None
+    if first_data_row == 2:
+        # Header and data are adjacent, so a single read covers both
+        values = get_sheet_data_with_api_v4(spreadsheet_id, sheet_name, api_key, 1, last_row)
+        if not values:
+            return None, None
+        return values[0], values[1:]
+    header_rows = get_sheet_data_with_api_v4(spreadsheet_id, sheet_name, api_key, 1, 1)
+    if not header_rows:
+        return None, None
+    values = get_sheet_data_with_api_v4(spreadsheet_id, sheet_name, api_key, first_data_row, last_row)
+    if values is None:
+        return None, None
+    return header_rows[0], values
+
 def get_row_options(spreadsheet_id, sheet_name, api_key):
     """
     Get available row count options based on actual data in the sheet.
@@ -237,23 +171,15 @@ def get_row_options(spreadsheet_id, sheet_name, api_key):
         if not api_key or not sheet_name:
             return []
         
-        # Get basic sheet data to determine row count
-        encoded_range = quote(f"{sheet_name}!A1:ZZ1000")
-        data_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{encoded_range}?key={api_key}"
-        
-        response = requests.get(data_url, headers={}, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
-        values = data.get('values', [])
-        
-        if not values:
+        # Row count comes from the cached tab metadata and data extent, not a data download
+        extent = sheets_metadata.get_data_extent(spreadsheet_id, sheet_name, api_key)
+        if not extent or not extent["rows"]:
             return []
         
         # Get actual row count (excluding header)
-        total_rows = len(values) - 1  # Subtract 1 for header row
+        total_rows = extent["rows"] - 1  # Subtract 1 for header row
         
-        print(f"DEBUG: Sheet has {total_rows} data rows (plus header)")
+        log.debug("Sheet has %s data rows (plus header)", total_rows)
         
         # Generate row options
         options = []
@@ -286,27 +212,30 @@ def get_row_options(spreadsheet_id, sheet_name, api_key):
                 "label": "First 1000 rows"
             })
         
-        print(f"DEBUG: Generated {len(options)} row options")
+        log.debug("Generated %s row options", len(options))
         return options
         
+    except sheets_http.ThrottledError:
+        raise
     except Exception as e:
-        print(f"DEBUG: get_row_options failed: {str(e)}")
+        log.warning("get_row_options failed: %s", e)
         return []
 
 @router.route("/content", methods=["POST"])
+@sheets_http.request_scoped_fetches
 def content():
     """
     Provide dynamic content for the module UI.
     Fetches sheet information from Google Sheets using API key and sheet ID.
     """
     try:
-        print("DEBUG: google_sheets_reader /content called")
+        log.debug("google_sheets_reader /content called")
 
         # Parse the request
         request = Request(flask_request)
         data = request.data
 
-        print(f"DEBUG: Parsed data = {data}")
+        log.debug("Parsed data = %s", data)
 
         # Get required parameters from form_data
         form_data = data.get("form_data", {})
@@ -322,29 +251,27 @@ def content():
 
         # Get requested content objects
         content_object_names = data.get("content_object_names", [])
-        content_objects = []
 
-        print(f"DEBUG: Content object names requested = {content_object_names}")
-        print(f"DEBUG: sheet_id = {sheet_id}")
-        print(f"DEBUG: api_key = {'[PROVIDED]' if api_key else '[NOT PROVIDED]'}")
+        log.debug("Content object names requested = %s", content_object_names)
+        log.debug("sheet_id = %s", sheet_id)
+        log.debug("api_key = %s", '[PROVIDED]' if api_key else '[NOT PROVIDED]')
 
         # Process each requested content object
-        for content_name in content_object_names:
+        def resolve_content_object(content_name):
             if content_name.get("id") == "sheet_names":
-                print("DEBUG: Processing sheet_names content object")
+                log.debug("Processing sheet_names content object")
                 
                 # If no sheet_id or api_key, return empty list
                 if not sheet_id or not api_key:
-                    print("DEBUG: Missing sheet_id or api_key, returning empty sheet_names")
-                    content_objects.append({
+                    log.debug("Missing sheet_id or api_key, returning empty sheet_names")
+                    return {
                         "content_object_name": "sheet_names",
                         "data": []
-                    })
-                    continue
+                    }
 
                 # Get sheet information using API v4
-                print("DEBUG: Fetching sheets using API v4")
-                available_sheets = get_sheets_with_api_v4(sheet_id, api_key)
+                log.debug("Fetching sheets using API v4")
+                available_sheets = sheets_metadata.get_sheets(sheet_id, api_key)
                 
                 # Format for StackSync - using the documentation format
                 sheet_options = []
@@ -354,16 +281,16 @@ def content():
                         "label": sheet["name"]
                     })
                 
-                print(f"DEBUG: Formatted {len(sheet_options)} sheet options")
-                print(f"DEBUG: Sheet options = {sheet_options}")
+                log.debug("Formatted %s sheet options", len(sheet_options))
+                log.debug("Sheet options = %s", sheet_options)
                 
-                content_objects.append({
+                return {
                     "content_object_name": "sheet_names",
                     "data": sheet_options
-                })
+                }
                 
             elif content_name.get("id") == "row_options":
-                print("DEBUG: Processing row_options content object")
+                log.debug("Processing row_options content object")
                 
                 # Need sheet_id, api_key, and sheet_name for row options
                 sheet_name_obj = form_data.get("sheet_name", "")
@@ -375,18 +302,17 @@ def content():
                 elif isinstance(sheet_name_obj, str):
                     sheet_name = sheet_name_obj
                 
-                print(f"DEBUG: sheet_name for row options = {sheet_name}")
+                log.debug("sheet_name for row options = %s", sheet_name)
                 
                 if not sheet_id or not api_key or not sheet_name:
-                    print("DEBUG: Missing sheet_id, api_key, or sheet_name, returning empty row_options")
-                    content_objects.append({
+                    log.debug("Missing sheet_id, api_key, or sheet_name, returning empty row_options")
+                    return {
                         "content_object_name": "row_options",
                         "data": []
-                    })
-                    continue
+                    }
                 
                 # Get row options
-                print("DEBUG: Fetching row options")
+                log.debug("Fetching row options")
                 available_rows = get_row_options(sheet_id, sheet_name, api_key)
                 
                 # Format for StackSync
@@ -397,16 +323,16 @@ def content():
                         "label": row_item["label"]
                     })
                 
-                print(f"DEBUG: Formatted {len(row_options)} row options")
-                print(f"DEBUG: Row options = {row_options}")
+                log.debug("Formatted %s row options", len(row_options))
+                log.debug("Row options = %s", row_options)
                 
-                content_objects.append({
+                return {
                     "content_object_name": "row_options",
                     "data": row_options
-                })
+                }
                 
             elif content_name.get("id") == "sheet_ranges":
-                print("DEBUG: Processing sheet_ranges content object")
+                log.debug("Processing sheet_ranges content object")
                 
                 # Need sheet_id, api_key, and sheet_name for ranges
                 sheet_name_obj = form_data.get("sheet_name", "")
@@ -418,18 +344,17 @@ def content():
                 elif isinstance(sheet_name_obj, str):
                     sheet_name = sheet_name_obj
                 
-                print(f"DEBUG: sheet_name for ranges = {sheet_name}")
+                log.debug("sheet_name for ranges = %s", sheet_name)
                 
                 if not sheet_id or not api_key or not sheet_name:
-                    print("DEBUG: Missing sheet_id, api_key, or sheet_name, returning empty sheet_ranges")
-                    content_objects.append({
+                    log.debug("Missing sheet_id, api_key, or sheet_name, returning empty sheet_ranges")
+                    return {
                         "content_object_name": "sheet_ranges",
                         "data": []
-                    })
-                    continue
+                    }
                 
                 # Get range information
-                print("DEBUG: Fetching sheet ranges")
+                log.debug("Fetching sheet ranges")
                 available_ranges = get_sheet_ranges(sheet_id, sheet_name, api_key)
                 
                 # Format for StackSync
@@ -440,37 +365,44 @@ def content():
                         "label": range_item["label"]
                     })
                 
-                print(f"DEBUG: Formatted {len(range_options)} range options")
-                print(f"DEBUG: Range options = {range_options}")
+                log.debug("Formatted %s range options", len(range_options))
+                log.debug("Range options = %s", range_options)
                 
-                content_objects.append({
+                return {
                     "content_object_name": "sheet_ranges",
                     "data": range_options
-                })
+                }
+
+        content_objects = content_fanout.resolve_in_order(content_object_names, resolve_content_object)
 
-        print(f"DEBUG: Returning {len(content_objects)} content objects")
-        print(f"DEBUG: Content objects = {content_objects}")
+        log.debug("Returning %s content objects", len(content_objects))
+        log.debug("Content objects = %s", content_objects)
 
         return Response(data={"content_objects": content_objects})
 
+    except sheets_http.ThrottledError as e:
+        log.warning("/content throttled: %s", e)
+        return Response.error(str(e))
     except Exception as e:
-        print(f"DEBUG: /content error = {e}")
+        log.warning("/content error = %s", e)
         import traceback
-        print(f"DEBUG: Full traceback = {traceback.format_exc()}")
+        log.debug("Full traceback = %s", traceback.format_exc())
         return Response(data={"content_objects": []})
 
 @router.route("/execute", methods=["POST"])
 def execute():
     """
     Execute the Google Sheets reading operation.
-    Fetches all data from specified sheet using API key and sheet ID.
+    Fetches data from specified sheet using API key and sheet ID. Only the rows
+    selected by row_offset/row_limit are requested from the API, either at once
+    or one page at a time when page_size is set (resume with next_cursor).
     """
     try:
-        print("DEBUG: google_sheets_reader /execute called")
+        log.debug("google_sheets_reader /execute called")
         # Parse the request
         request = Request(flask_request)
         data = request.data
-        print(f"DEBUG: Parsed data = {data}")
+        log.debug("Parsed data = %s", data)
         # Get required parameters
         sheet_id = data.get("sheet_id", "")
         api_key = API_KEY
@@ -481,27 +413,59 @@ def execute():
             sheet_name = sheet_name_obj.get("id", "") or sheet_name_obj.get("label", "") or sheet_name_obj.get("value", "")
         elif isinstance(sheet_name_obj, str):
             sheet_name = sheet_name_obj
-        print(f"DEBUG: Raw sheet_name_obj = {sheet_name_obj}")
-        print(f"DEBUG: Processed sheet_name = {sheet_name}")
+        log.debug("Raw sheet_name_obj = %s", sheet_name_obj)
+        log.debug("Processed sheet_name = %s", sheet_name)
         if not sheet_id:
             return Response.error("Sheet ID is required")
         if not api_key:
             return Response.error("API key is required")
         if not sheet_name:
             return Response.error("Sheet name is required")
-        print(f"DEBUG: sheet_id = {sheet_id}")
-        print(f"DEBUG: sheet_name = {sheet_name}")
-        print(f"DEBUG: api_key = [PROVIDED]")
+        log.debug("sheet_id = %s", sheet_id)
+        log.debug("sheet_name = %s", sheet_name)
+        log.debug("api_key = [PROVIDED]")
+        # Row window: row_limit comes from the row_options dropdown ("all" or a count)
+        row_limit_obj = data.get("row_limit", "")
+        if isinstance(row_limit_obj, dict):
+            row_limit_obj = row_limit_obj.get("id", "") or row_limit_obj.get("value", "")
+        row_offset = data.get("row_offset")
+        # Pagination: cursor is the sheet row number the page starts at
+        page_size = data.get("page_size")
+        cursor = data.get("cursor")
+        try:
+            row_limit = int(row_limit_obj) if row_limit_obj not in (None, "", "all") else 0
+            row_offset = int(row_offset) if row_offset not in (None, "") else 0
+            page_size = int(page_size) if page_size not in (None, "") else 0
+            window_start = 2 + row_offset  # +2 because first row is headers
+            first_data_row = int(cursor) if cursor not in (None, "") else window_start
+        except (TypeError, ValueError):
+            return Response.error("row_limit, row_offset and page_size must be numbers and cursor must be a next_cursor from a previous page")
+        if row_limit < 0 or row_offset < 0 or page_size < 0 or first_data_row < window_start:
+            return Response.error("row_limit, row_offset and page_size must be >= 0 and cursor must lie inside the selected rows")
+        window_end = window_start + row_limit - 1 if row_limit else None
+        # Only request the rows that will be returned
+        row_count = page_size + 1 if page_size else None  # one extra row tells whether another page follows
+        if window_end is not None:
+            remaining = max(window_end - first_data_row + 1, 0)
+            row_count = remaining if row_count is None else min(row_count, remaining)
         # Get data using API v4
-        api_v4_data = get_sheet_data_with_api_v4(sheet_id, sheet_name, api_key)
-        if not api_v4_data:
+        headers, data_rows = get_header_and_rows(sheet_id, sheet_name, api_key, first_data_row, row_count)
+        if headers is None:
             return Response.error("Failed to fetch data from Google Sheet")
-        if len(api_v4_data) < 1:
-            return Response.error("No data found in the sheet")
-        # First row as headers
-        headers = api_v4_data[0]
-        all_data_rows = api_v4_data[1:]
-        data_rows = all_data_rows  # Always return all rows
+        next_cursor = None
+        if page_size:
+            next_row = first_data_row + page_size
+            if len(data_rows) > page_size:
+                data_rows = data_rows[:page_size]
+                next_cursor = str(next_row)
+            elif window_end is None or next_row <= window_end:
+                # Trailing blank rows are trimmed from the page, so a short page
+                # does not mean the tab ends here; probe for data from next_row on
+                last_row = sheets_metadata.find_last_row(sheet_id, sheet_name, api_key, next_row) or 0
+                if window_end is not None:
+                    last_row = min(last_row, window_end)
+                if next_row <= last_row:
+                    next_cursor = str(next_row)
         # Convert to JSON format
         structured_data = []
         for i, row in enumerate(data_rows):
@@ -509,9 +473,9 @@ def execute():
             for j, header in enumerate(headers):
                 value = row[j] if j < len(row) else ""
                 row_dict[header] = value
-            row_dict["_row_number"] = i + 2  # +2 because first row is headers
+            row_dict["_row_number"] = first_data_row + i
             structured_data.append(row_dict)
-        print(f"DEBUG: Processed {len(structured_data)} data rows")
+        log.debug("Processed %s data rows", len(structured_data))
         # Create response
         result = {
             "sheet_id": sheet_id,
@@ -521,13 +485,21 @@ def execute():
             "total_records": len(structured_data),
             "total_fields": len(headers)
         }
+        if page_size:
+            result["page_size"] = page_size
+            result["cursor"] = str(first_data_row)
+            result["next_cursor"] = next_cursor
+        if row_limit or row_offset or page_size:
+            scope = f"rows {first_data_row}-{first_data_row + len(structured_data) - 1}" if structured_data else "no rows"
+        else:
+            scope = "all rows"
         return Response(
             data=result,
             metadata={
                 "affected_records": len(structured_data),
-                "message": f"Successfully fetched {len(structured_data)} records from sheet '{sheet_name}' (all rows)"
+                "message": f"Successfully fetched {len(structured_data)} records from sheet '{sheet_name}' ({scope})"
             }
         )
     except Exception as e:
-        print(f"DEBUG: /execute error = {e}")
+        log.warning("/execute error = %s", e)
         return Response.error(str(e))
\ No newline at end of file
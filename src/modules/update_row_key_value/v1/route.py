@@ -1,72 +1,56 @@
 from flask import request as flask_request
 from workflows_cdk import Response, Request
 from main import router
-import requests
-from urllib.parse import quote
+from src.common import app_log, content_fanout, sheets_auth, sheets_http, sheets_key_index, sheets_metadata, sheets_ranges, sheets_values
 import os
 import json
 
+log = app_log.get_logger(__name__)
+
 # === ENVIRONMENT VARIABLES ===
 API_KEY = os.environ.get("GOOGLE_SHEETS_API_KEY")
 SERVICE_ACCOUNT_JSON_STR = os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON")
 SERVICE_ACCOUNT_JSON = json.loads(SERVICE_ACCOUNT_JSON_STR) if SERVICE_ACCOUNT_JSON_STR else None
 # === END ENVIRONMENT VARIABLES ===
 
-def get_sheets_with_api_v4(spreadsheet_id):
+def get_sheet_header(spreadsheet_id, sheet_name):
     try:
-        metadata_url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}?key={API_KEY}"
-        response = requests.get(metadata_url, timeout=10)
-        if response.status_code != 200:
-            return []
-        metadata = response.json()
-        sheets = metadata.get('sheets', [])
-        return [{"name": s['properties']['title'], "gid": s['properties']['sheetId']} for s in sheets]
+        return sheets_values.get_header(spreadsheet_id, sheet_name, API_KEY)
+    except sheets_http.ThrottledError:
+        raise
     except Exception as e:
-        print(f"DEBUG: get_sheets_with_api_v4 failed: {str(e)}")
+        log.warning("get_sheet_header failed: %s", e)
         return []
 
-def get_sheet_header(spreadsheet_id, sheet_name):
+def get_column_values(spreadsheet_id, sheet_name, key_column, search="", limit=None, offset=0):
+    """
+    Return (options, total) for one page of distinct key values, served from the
+    cached key index (header row plus key column only).
+    """
     try:
-        range_string = f"{sheet_name}!1:1"
-        encoded_range = quote(range_string)
-        url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{encoded_range}?key={API_KEY}"
-        resp = requests.get(url, timeout=10)
-        if resp.status_code != 200:
-            return []
-        data = resp.json().get("values", [])
-        if not data:
-            return []
-        return data[0]
+        values, total = sheets_key_index.distinct_values(
+            spreadsheet_id, sheet_name, key_column, API_KEY, search=search, limit=limit, offset=offset
+        )
+        value_options = [{"value": {"id": val, "label": str(val)}, "label": str(val)} for val in values]
+        return value_options, total
+    except sheets_http.ThrottledError:
+        raise
     except Exception as e:
-        print(f"DEBUG: get_sheet_header failed: {str(e)}")
-        return []
+        log.warning("get_column_values failed: %s", e)
+        return [], 0
 
-def get_column_values(spreadsheet_id, sheet_name, key_column):
+def get_page_param(content_name, form_data, name, default):
+    """
+    Read a non-negative integer paging parameter from the content object request or the form.
+    """
+    value = content_name.get(name, form_data.get(f"key_values_{name}"))
     try:
-        range_string = f"{sheet_name}"
-        encoded_range = quote(range_string)
-        url = f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}/values/{encoded_range}?key={API_KEY}"
-        resp = requests.get(url, timeout=10)
-        all_values = resp.json().get("values", [])
-        if not all_values or len(all_values) < 2:
-            return []
-        header = all_values[0]
-        if key_column not in header:
-            return []
-        col_idx = header.index(key_column)
-        value_options = []
-        seen = set()
-        for row in all_values[1:]:
-            val = row[col_idx] if col_idx < len(row) else ""
-            if val and val not in seen:
-                value_options.append({"value": {"id": val, "label": str(val)}, "label": str(val)})
-                seen.add(val)
-        return value_options
-    except Exception as e:
-        print(f"DEBUG: get_column_values failed: {str(e)}")
-        return []
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return default
 
 @router.route("/content", methods=["POST"])
+@sheets_http.request_scoped_fetches
 def content():
     try:
         request = Request(flask_request)
@@ -86,37 +70,51 @@ def content():
         elif isinstance(key_column_obj, str):
             key_column = key_column_obj
         content_object_names = data.get("content_object_names", [])
-        content_objects = []
-        for content_name in content_object_names:
+        def resolve_content_object(content_name):
             cid = content_name.get("id")
             if cid == "sheet_names":
                 if not sheet_id:
-                    content_objects.append({"content_object_name": "sheet_names", "data": []})
-                    continue
-                available_sheets = get_sheets_with_api_v4(sheet_id)
+                    return {"content_object_name": "sheet_names", "data": []}
+                available_sheets = sheets_metadata.get_sheets(sheet_id, API_KEY)
                 sheet_options = [{"value": {"id": s["name"], "label": s["name"]}, "label": s["name"]} for s in available_sheets]
-                content_objects.append({"content_object_name": "sheet_names", "data": sheet_options})
+                return {"content_object_name": "sheet_names", "data": sheet_options}
             elif cid == "column_names":
                 if not sheet_id or not sheet_name:
-                    content_objects.append({"content_object_name": "column_names", "data": []})
-                    continue
+                    return {"content_object_name": "column_names", "data": []}
                 header = get_sheet_header(sheet_id, sheet_name)
                 options = [{"value": {"id": col, "label": col}, "label": col} for col in header]
-                content_objects.append({"content_object_name": "column_names", "data": options})
+                return {"content_object_name": "column_names", "data": options}
             elif cid == "key_columns":
                 if not sheet_id or not sheet_name:
-                    content_objects.append({"content_object_name": "key_columns", "data": []})
-                    continue
+                    return {"content_object_name": "key_columns", "data": []}
                 header = get_sheet_header(sheet_id, sheet_name)
                 options = [{"value": {"id": col, "label": col}, "label": col} for col in header]
-                content_objects.append({"content_object_name": "key_columns", "data": options})
+                return {"content_object_name": "key_columns", "data": options}
             elif cid == "key_values":
                 if not sheet_id or not sheet_name or not key_column:
-                    content_objects.append({"content_object_name": "key_values", "data": []})
-                    continue
-                value_options = get_column_values(sheet_id, sheet_name, key_column)
-                content_objects.append({"content_object_name": "key_values", "data": value_options})
+                    return {"content_object_name": "key_values", "data": []}
+                # Prefix search and paging, from the content object request or the
+                # key_values_search/limit/offset form fields; pages hold at most
+                # SHEETS_KEY_VALUES_PAGE_SIZE values by default
+                search = str(content_name.get("search", form_data.get("key_values_search", "")) or "")
+                limit = get_page_param(content_name, form_data, "limit", None)
+                offset = get_page_param(content_name, form_data, "offset", 0)
+                value_options, total = get_column_values(sheet_id, sheet_name, key_column, search, limit, offset)
+                next_offset = offset + len(value_options)
+                return {
+                    "content_object_name": "key_values",
+                    "data": value_options,
+                    "pagination": {
+                        "offset": offset,
+                        "total": total,
+                        "next_offset": next_offset if next_offset < total else None
+                    }
+                }
+
+        content_objects = content_fanout.resolve_in_order(content_object_names, resolve_content_object)
         return Response(data={"content_objects": content_objects})
+    except sheets_http.ThrottledError as e:
+        return Response.error(str(e))
     except Exception as e:
         return Response(data={"content_objects": []})
 
@@ -159,58 +157,40 @@ def execute():
             return Response.error("Row data is required")
         if not key_column or not key_value:
             return Response.error("Key column and key value are required")
-        range_string = f"{sheet_name}"
-        encoded_range = quote(range_string)
-        url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}/values/{encoded_range}?key={API_KEY}"
-        resp = requests.get(url, timeout=10)
-        all_values = resp.json().get("values", [])
-        if not all_values or len(all_values) < 2:
+        # Look the rows up in the shared key index instead of reading the whole tab
+        header, rows_to_update = sheets_key_index.find_rows(sheet_id, sheet_name, key_column, key_value, API_KEY)
+        if not header:
             return Response.error("Could not fetch sheet data to determine rows to update.")
-        header = all_values[0]
-        if key_column not in header:
+        if rows_to_update is None:
             return Response.error(f"Key column '{key_column}' not found in header: {header}")
-        key_col_idx = header.index(key_column)
         col_name_to_idx = {col: idx for idx, col in enumerate(header)}
-        rows_to_update = []
-        for i, row in enumerate(all_values[1:], start=2):
-            val = row[key_col_idx] if key_col_idx < len(row) else ""
-            if val == key_value:
-                rows_to_update.append((i, row))
         if not rows_to_update:
             return Response.error(f"No rows found where '{key_column}' == '{key_value}'")
-        from google.oauth2 import service_account
-        from google.auth.transport.requests import Request as GoogleRequest
-        account_info = service_account_json
-        scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-        creds = service_account.Credentials.from_service_account_info(account_info, scopes=scopes)
-        creds.refresh(GoogleRequest())
-        token = creds.token
-        batch_url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}/values:batchUpdate"
-        data_updates = []
-        for row_num, row in rows_to_update:
-            updated_row = list(row) + [""] * (len(header) - len(row))
-            for item in row_data:
-                col_name = item.get("column_name", "")
-                col_value = item.get("column_value", "")
-                if isinstance(col_name, dict):
-                    col_name = col_name.get("id", "") or col_name.get("label", "") or col_name.get("value", "")
-                if col_name in col_name_to_idx:
-                    updated_row[col_name_to_idx[col_name]] = col_value
-            for item in row_data:
-                col_name = item.get("column_name", "")
-                if isinstance(col_name, dict):
-                    col_name = col_name.get("id", "") or col_name.get("label", "") or col_name.get("value", "")
-                if col_name in col_name_to_idx:
-                    col_idx = col_name_to_idx[col_name]
-                    col_letter = chr(col_idx + ord('A'))
-                    range_name = f"{sheet_name}!{col_letter}{row_num}"
-                    data_updates.append({
-                        "range": range_name,
-                        "majorDimension": "ROWS",
-                        "values": [[updated_row[col_idx]]]
-                    })
-        if not data_updates:
+        # New value per column index; the last entry wins if a column is listed twice
+        new_values = {}
+        for item in row_data:
+            col_name = item.get("column_name", "")
+            if isinstance(col_name, dict):
+                col_name = col_name.get("id", "") or col_name.get("label", "") or col_name.get("value", "")
+            if col_name in col_name_to_idx:
+                new_values[col_name_to_idx[col_name]] = item.get("column_value", "")
+        if not new_values:
             return Response.error("No columns to update.")
+        # Every matched row gets the same values, so write one rectangle per
+        # (contiguous row run, contiguous column run) instead of one range per cell
+        row_spans = sheets_ranges.coalesce_runs(rows_to_update)
+        col_spans = sheets_ranges.coalesce_runs(new_values.keys())
+        data_updates = []
+        for first_row, last_row in row_spans:
+            for first_col, last_col in col_spans:
+                block_row = [new_values[col_idx] for col_idx in range(first_col, last_col + 1)]
+                data_updates.append({
+                    "range": sheets_ranges.a1_range(sheet_name, first_row, first_col, last_row, last_col),
+                    "majorDimension": "ROWS",
+                    "values": [block_row] * (last_row - first_row + 1)
+                })
+        token = sheets_auth.get_access_token(sheets_auth.SPREADSHEETS_SCOPES, service_account_json)
+        batch_url = f"https://sheets.googleapis.com/v4/spreadsheets/{sheet_id}/values:batchUpdate"
         body = {
             "valueInputOption": "USER_ENTERED",
             "data": data_updates,
@@ -220,7 +200,7 @@ def execute():
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
         }
-        resp = requests.post(batch_url, headers=headers, json=body, timeout=30)
+        resp = sheets_http.post(batch_url, headers=headers, json=body, timeout=30)
         if resp.status_code not in [200, 201]:
             error_detail = resp.text
             try:
@@ -230,8 +210,9 @@ def execute():
                 pass
             return Response.error(f"Failed to update rows: {error_detail}")
         result = resp.json()
+        sheets_key_index.record_update(sheet_id, sheet_name, rows_to_update, new_values)
         updated_rows = len(rows_to_update)
-        updated_cells = len(data_updates)
+        updated_cells = updated_rows * len(new_values)
         return Response(
             data={
                 "sheet_id": sheet_id,